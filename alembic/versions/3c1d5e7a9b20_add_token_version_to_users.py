@@ -0,0 +1,28 @@
+"""add token_version to users
+
+Revision ID: 3c1d5e7a9b20
+Revises: fc2568d6300b
+Create Date: 2026-10-18 12:40:05.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1d5e7a9b20'
+down_revision: Union[str, None] = 'fc2568d6300b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('token_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'token_version')
@@ -0,0 +1,32 @@
+"""add feed_items story_id index
+
+Revision ID: 4d8b1f6a2c93
+Revises: 7a5f2e9c3d14
+Create Date: 2026-10-18 22:31:04.518377
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d8b1f6a2c93'
+down_revision: Union[str, None] = '7a5f2e9c3d14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        # The expiry sweep deletes feed rows by story; the primary key and the
+        # feed index both lead with user_id
+        op.create_index('ix_feed_items_story_id', 'feed_items', ['story_id'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_feed_items_story_id', table_name='feed_items', postgresql_concurrently=True)
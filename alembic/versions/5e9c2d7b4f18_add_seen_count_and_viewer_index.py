@@ -0,0 +1,51 @@
+"""add seen count and viewer index
+
+Revision ID: 5e9c2d7b4f18
+Revises: d41e8b6f2a95
+Create Date: 2026-10-18 18:05:33.618420
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e9c2d7b4f18'
+down_revision: Union[str, None] = 'd41e8b6f2a95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('stories', sa.Column('seen_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE stories SET seen_count = s.count
+        FROM (SELECT story_id, count(*) AS count FROM user_seen_stories GROUP BY story_id) AS s
+        WHERE s.story_id = stories.id
+    """)
+
+    with op.get_context().autocommit_block():
+        # Viewer pages: the (seen_at, user_id) keyset within a story. Also
+        # serves every lookup by story_id, so it replaces the plain index.
+        op.create_index(
+            'ix_user_seen_stories_story_id_seen_at', 'user_seen_stories',
+            ['story_id', sa.text('seen_at DESC'), sa.text('user_id DESC')],
+            postgresql_concurrently=True
+        )
+        op.drop_index('ix_user_seen_stories_story_id', table_name='user_seen_stories', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_seen_stories_story_id', 'user_seen_stories', ['story_id'],
+            postgresql_concurrently=True
+        )
+        op.drop_index(
+            'ix_user_seen_stories_story_id_seen_at', table_name='user_seen_stories', postgresql_concurrently=True
+        )
+    op.drop_column('stories', 'seen_count')
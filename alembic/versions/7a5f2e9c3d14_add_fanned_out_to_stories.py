@@ -0,0 +1,50 @@
+"""add fanned_out to stories
+
+Revision ID: 7a5f2e9c3d14
+Revises: e2b9d4c61a07
+Create Date: 2026-10-18 21:42:16.305918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a5f2e9c3d14'
+down_revision: Union[str, None] = 'e2b9d4c61a07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('stories', sa.Column('fanned_out', sa.Boolean(), server_default='true', nullable=False))
+    # Live stories in no feed but their author's were posted above the
+    # threshold. Also catches stories whose author had no followers, which
+    # the read-time merge handles just as well.
+    op.execute("""
+        UPDATE stories SET fanned_out = false
+        WHERE is_active AND NOT EXISTS (
+            SELECT 1 FROM feed_items
+            WHERE feed_items.story_id = stories.id AND feed_items.user_id <> stories.user_id
+        )
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_stories_active_not_fanned_out_user_id_created_at', 'stories',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_where=sa.text('is_active = true AND fanned_out = false'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_stories_active_not_fanned_out_user_id_created_at', table_name='stories',
+            postgresql_concurrently=True
+        )
+    op.drop_column('stories', 'fanned_out')
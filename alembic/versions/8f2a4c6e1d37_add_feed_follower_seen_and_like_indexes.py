@@ -0,0 +1,63 @@
+"""add feed, follower, seen and like indexes
+
+Revision ID: 8f2a4c6e1d37
+Revises: 3c1d5e7a9b20
+Create Date: 2026-10-18 13:02:41.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f2a4c6e1d37'
+down_revision: Union[str, None] = '3c1d5e7a9b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY so live tables are not locked against writes while the
+    # indexes build; it cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        # GET /stories/me: an author's stories, newest first
+        op.create_index(
+            'ix_stories_user_id_created_at', 'stories',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True
+        )
+        # GET /stories/: active stories of a set of authors, newest first
+        op.create_index(
+            'ix_stories_active_user_id_created_at', 'stories',
+            ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_where=sa.text('is_active = true'),
+            postgresql_concurrently=True
+        )
+        # /me/followers: the primary key (follower_id, followed_id) only helps the other direction
+        op.create_index(
+            'ix_user_followers_followed_id_follower_id', 'user_followers',
+            ['followed_id', 'follower_id'],
+            postgresql_concurrently=True
+        )
+        # Viewers and likers of a story
+        op.create_index(
+            'ix_user_seen_stories_story_id', 'user_seen_stories', ['story_id'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_user_liked_stories_story_id', 'user_liked_stories', ['story_id'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_liked_stories_story_id', table_name='user_liked_stories', postgresql_concurrently=True)
+        op.drop_index('ix_user_seen_stories_story_id', table_name='user_seen_stories', postgresql_concurrently=True)
+        op.drop_index('ix_user_followers_followed_id_follower_id', table_name='user_followers', postgresql_concurrently=True)
+        op.drop_index('ix_stories_active_user_id_created_at', table_name='stories', postgresql_concurrently=True)
+        op.drop_index('ix_stories_user_id_created_at', table_name='stories', postgresql_concurrently=True)
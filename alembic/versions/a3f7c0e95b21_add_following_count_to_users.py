@@ -0,0 +1,33 @@
+"""add following count to users
+
+Revision ID: a3f7c0e95b21
+Revises: 5e9c2d7b4f18
+Create Date: 2026-10-18 19:12:48.402957
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f7c0e95b21'
+down_revision: Union[str, None] = '5e9c2d7b4f18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE users SET following_count = f.count
+        FROM (SELECT follower_id, count(*) AS count FROM user_followers GROUP BY follower_id) AS f
+        WHERE f.follower_id = users.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'following_count')
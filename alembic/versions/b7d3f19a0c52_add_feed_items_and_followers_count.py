@@ -0,0 +1,64 @@
+"""add feed items and followers count
+
+Revision ID: b7d3f19a0c52
+Revises: 8f2a4c6e1d37
+Create Date: 2026-10-18 15:21:07.284113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d3f19a0c52'
+down_revision: Union[str, None] = '8f2a4c6e1d37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('followers_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute("""
+        UPDATE users SET followers_count = f.count
+        FROM (SELECT followed_id, count(*) AS count FROM user_followers GROUP BY followed_id) AS f
+        WHERE f.followed_id = users.id
+    """)
+
+    op.create_table('feed_items',
+        sa.Column('user_id', sa.UUID(), nullable=False),
+        sa.Column('story_id', sa.UUID(), nullable=False),
+        sa.Column('author_id', sa.UUID(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['author_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['story_id'], ['stories.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'story_id')
+    )
+    # Backfill with the active stories each user currently sees: their own and
+    # those of everyone they follow. Authors above the fan-out threshold are
+    # included too; the feed query drops the duplicates.
+    op.execute("""
+        INSERT INTO feed_items (user_id, story_id, author_id, created_at)
+        SELECT user_id, id, user_id, created_at FROM stories
+        WHERE is_active AND user_id IS NOT NULL AND created_at IS NOT NULL
+        UNION
+        SELECT f.follower_id, s.id, s.user_id, s.created_at
+        FROM user_followers AS f
+        JOIN stories AS s ON s.user_id = f.followed_id
+        WHERE s.is_active AND s.created_at IS NOT NULL
+    """)
+    # Built after the backfill, which is much faster than maintaining it row by row
+    op.create_index(
+        'ix_feed_items_user_id_created_at', 'feed_items',
+        ['user_id', sa.text('created_at DESC'), sa.text('story_id DESC')]
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_feed_items_user_id_created_at', table_name='feed_items')
+    op.drop_table('feed_items')
+    op.drop_column('users', 'followers_count')
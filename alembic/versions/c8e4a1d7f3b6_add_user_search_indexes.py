@@ -0,0 +1,58 @@
+"""add user search indexes
+
+Revision ID: c8e4a1d7f3b6
+Revises: a3f7c0e95b21
+Create Date: 2026-10-18 19:48:07.215364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e4a1d7f3b6'
+down_revision: Union[str, None] = 'a3f7c0e95b21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # pg_trgm ships with Postgres' contrib modules, which not every install has.
+    # Without it search is prefix-only (see app/utils/user_search.py).
+    has_trigram = op.get_bind().scalar(
+        sa.text("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+    )
+    if has_trigram:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_users_username_prefix', 'users', [sa.text('lower(username) text_pattern_ops')],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_users_fullname_prefix', 'users', [sa.text('lower(fullname) text_pattern_ops')],
+            postgresql_concurrently=True
+        )
+        if has_trigram:
+            # Fuzzy matches; not in the models, so alembic/env.py skips them in autogenerate
+            op.create_index(
+                'ix_users_username_trgm', 'users', ['username'],
+                postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'}, postgresql_concurrently=True
+            )
+            op.create_index(
+                'ix_users_fullname_trgm', 'users', ['fullname'],
+                postgresql_using='gin', postgresql_ops={'fullname': 'gin_trgm_ops'}, postgresql_concurrently=True
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_fullname_trgm', table_name='users', if_exists=True, postgresql_concurrently=True)
+        op.drop_index('ix_users_username_trgm', table_name='users', if_exists=True, postgresql_concurrently=True)
+        op.drop_index('ix_users_fullname_prefix', table_name='users', postgresql_concurrently=True)
+        op.drop_index('ix_users_username_prefix', table_name='users', postgresql_concurrently=True)
@@ -0,0 +1,36 @@
+"""add active stories created_at index
+
+Revision ID: d41e8b6f2a95
+Revises: b7d3f19a0c52
+Create Date: 2026-10-18 16:48:12.907331
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41e8b6f2a95'
+down_revision: Union[str, None] = 'b7d3f19a0c52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        # Expiry sweeps: oldest active stories first. Partial, so it only
+        # holds about one STORY_TTL_HOURS worth of stories.
+        op.create_index(
+            'ix_stories_active_created_at', 'stories', ['created_at'],
+            postgresql_where=sa.text('is_active = true'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_stories_active_created_at', table_name='stories', postgresql_concurrently=True)
@@ -0,0 +1,40 @@
+"""add story like deltas
+
+Revision ID: e2b9d4c61a07
+Revises: c8e4a1d7f3b6
+Create Date: 2026-10-18 21:05:31.874220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b9d4c61a07'
+down_revision: Union[str, None] = 'c8e4a1d7f3b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('story_like_deltas',
+    sa.Column('id', sa.BigInteger(), sa.Identity(always=False), nullable=False),
+    sa.Column('story_id', sa.UUID(), nullable=False),
+    sa.Column('delta', sa.SmallInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['story_id'], ['stories.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Fold in likes not merged yet so likes_count stays right
+    op.execute("""
+        UPDATE stories SET likes_count = stories.likes_count + d.delta
+        FROM (SELECT story_id, sum(delta) AS delta FROM story_like_deltas GROUP BY story_id) AS d
+        WHERE d.story_id = stories.id
+    """)
+    op.drop_table('story_like_deltas')
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+from dotenv import load_dotenv
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from ..models import User
+from ..utils.cache import TTLCache
+from ..utils.metrics import register_collector
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+# Optional: share invalidations between workers over Redis pub/sub
+PRINCIPAL_CACHE_REDIS_URL = os.getenv("PRINCIPAL_CACHE_REDIS_URL")
+INVALIDATION_CHANNEL = "principal-cache:invalidate"
+
+# Token subject -> column values of the authenticated user. Plain values rather
+# than ORM objects, so each request gets its own instance bound to its session.
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+register_collector("principal_cache", principal_cache.stats)
+
+_redis = None
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        # redis is only needed when PRINCIPAL_CACHE_REDIS_URL is set
+        import redis.asyncio as redis
+        _redis = redis.from_url(PRINCIPAL_CACHE_REDIS_URL)
+    return _redis
+
+def _snapshot(user: User) -> dict:
+    return {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs}
+
+async def load_principal(db: AsyncSession, subject: str) -> Optional[User]:
+    """
+    Return the user for a token subject (email), attached to `db`.
+    Served from the principal cache when possible, otherwise loaded and cached.
+    """
+    snapshot = principal_cache.get(subject)
+    if snapshot is not None:
+        user = User(**snapshot)
+        # Mark the rebuilt instance as an unmodified, already-persisted row
+        make_transient_to_detached(user)
+        db.add(user)
+        return user
+
+    result = await db.execute(select(User).where(User.email == subject))
+    user = result.scalars().first()
+    if user is not None:
+        principal_cache.set(subject, _snapshot(user))
+    return user
+
+async def invalidate_principal(*subjects: str) -> None:
+    """Drop cached principals after a write that changes them, on every worker"""
+    for subject in subjects:
+        principal_cache.pop(subject)
+    if PRINCIPAL_CACHE_REDIS_URL:
+        try:
+            redis = _get_redis()
+            for subject in subjects:
+                await redis.publish(INVALIDATION_CHANNEL, subject)
+        except Exception:
+            # Other workers fall back to the TTL
+            logger.exception("Failed to publish principal cache invalidation")
+
+async def listen_for_invalidations() -> None:
+    """Apply invalidations published by other workers; runs for the app's lifetime"""
+    while True:
+        try:
+            pubsub = _get_redis().pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything cached while we were not subscribed may be stale
+            principal_cache.clear()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    principal_cache.pop(message["data"].decode())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Principal cache invalidation listener failed, retrying")
+            await asyncio.sleep(1)
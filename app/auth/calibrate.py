@@ -0,0 +1,55 @@
+"""
+Pick the bcrypt cost for this host.
+
+Measures how long one bcrypt hash takes at increasing cost factors and
+reports the highest cost whose median hash time fits the latency budget:
+
+    python -m app.auth.calibrate --target-ms 250
+    python -m app.auth.calibrate --target-ms 250 --write   # store BCRYPT_ROUNDS in .env
+
+Existing hashes are moved to the new cost transparently on each user's next login.
+"""
+import argparse
+import statistics
+import time
+
+from dotenv import set_key
+from passlib.hash import bcrypt
+
+MIN_ROUNDS = 10  # never go below this, whatever the hardware
+MAX_ROUNDS = 16
+
+def measure(rounds: int, samples: int) -> float:
+    """Median seconds for one hash at the given cost"""
+    hasher = bcrypt.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.hash("calibration-password")
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def calibrate(target_ms: float, samples: int) -> int:
+    chosen = MIN_ROUNDS
+    for rounds in range(MIN_ROUNDS, MAX_ROUNDS + 1):
+        took_ms = measure(rounds, samples) * 1000
+        fits = took_ms <= target_ms
+        print(f"rounds={rounds:<3} median={took_ms:8.1f} ms {'ok' if fits else 'over budget'}")
+        if not fits:
+            break
+        chosen = rounds
+    return chosen
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250, help="latency budget for one hash")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--write", action="store_true", help="store the result in the env file")
+    parser.add_argument("--env-file", default=".env")
+    args = parser.parse_args()
+
+    rounds = calibrate(args.target_ms, args.samples)
+    print(f"BCRYPT_ROUNDS={rounds}")
+    if args.write:
+        set_key(args.env_file, "BCRYPT_ROUNDS", str(rounds), quote_mode="never")
+        print(f"Wrote BCRYPT_ROUNDS={rounds} to {args.env_file}")
@@ -0,0 +1,30 @@
+import os
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+
+from .utils import get_password_hash, verify_and_update_password
+from ..utils.bounded_pool import BoundedPool
+from ..utils.metrics import register_collector
+
+load_dotenv()
+
+# bcrypt releases the GIL while hashing, so a thread pool gives real parallelism
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs allowed to wait for a worker before new ones are shed with 503
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "32"))
+
+_pool = BoundedPool("password-hash", PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE)
+
+async def hash_password(password: str) -> str:
+    return await _pool.run(get_password_hash, password)
+
+async def check_password_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return await _pool.run(verify_and_update_password, plain_password, hashed_password)
+
+def shutdown_hasher() -> None:
+    _pool.shutdown()
+
+def hasher_stats() -> dict:
+    return _pool.stats()
+
+register_collector("password_hash", hasher_stats)
@@ -1,22 +1,57 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+from uuid import UUID
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Request, Depends
 import os
 from dotenv import load_dotenv
 
+from ..database import get_request_session
+from ..models import User
+from .cache import load_principal
+
 load_dotenv()
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = os.getenv("JWT_ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("JWT_REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+# Version of the claim set below; tokens without "ver" only carry "sub"
+TOKEN_CLAIMS_VERSION = 2
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+@dataclass(frozen=True)
+class Principal:
+    """The caller's identity as carried by the access token, no database needed"""
+    id: UUID
+    email: str
+    username: str
+    token_version: int
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor; pick it per host with `python -m app.auth.calibrate`
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# min/max pin the desired cost, so hashes made with any other cost report
+# needs_update and get rehashed on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also returns a new hash when the stored one uses a stale cost"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
@@ -30,9 +65,49 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _user_claims(user: User, token_type: str) -> dict:
+    return {
+        "sub": user.email,
+        "uid": str(user.id),
+        "username": user.username,
+        "tv": user.token_version,
+        "ver": TOKEN_CLAIMS_VERSION,
+        "type": token_type,
+    }
+
+def create_user_tokens(user: User) -> dict:
+    """Issue a short-lived access token and a long-lived refresh token for a user"""
+    access_token = create_access_token(
+        _user_claims(user, ACCESS_TOKEN_TYPE),
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = create_access_token(
+        _user_claims(user, REFRESH_TOKEN_TYPE),
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+def principal_from_claims(payload: dict) -> Optional[Principal]:
+    """Build the principal from a versioned access token, None for legacy tokens"""
+    if payload.get("ver") != TOKEN_CLAIMS_VERSION:
+        return None
+    return Principal(
+        id=UUID(payload["uid"]),
+        email=payload["sub"],
+        username=payload["username"],
+        token_version=payload["tv"],
+    )
+
+def principal_from_user(user: User) -> Principal:
+    return Principal(id=user.id, email=user.email, username=user.username, token_version=user.token_version)
+
+def decode_token(token: str) -> dict:
+    """Decode and validate a JWT; raises JWTError when it is invalid or expired"""
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
 def verify_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         return payload
     except JWTError:
         raise HTTPException(
@@ -41,16 +116,36 @@ def verify_token(token: str) -> dict:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_user_from_request(request: Request):
+def get_current_principal(request: Request) -> Principal:
+    """
+    Retrieve the authenticated caller's identity from the request state.
+    Use this instead of the full user when only the id/username is needed;
+    it never touches the database.
+    """
+    state = request.scope.get("state", {})
+    principal = state.get("principal")
+    
+    if principal is None:
+        raise HTTPException(status_code=401, detail="User not authenticated")
+    
+    return principal
+
+async def get_current_user_from_request(request: Request) -> User:
     """
     Retrieve the current authenticated user from the request state.
-    This pulls the user that was already authenticated by the middleware.
+    The user row is loaded on first use (through the principal cache) into the
+    request's session, so handlers that never ask for it skip the lookup.
     """
     # Get state from request scope
     state = request.scope.get("state", {})
     user = state.get("user")
+    if user is not None:
+        return user
     
-    if user is None:
+    principal = get_current_principal(request)
+    user = await load_principal(get_request_session(request.scope), principal.email)
+    if user is None or user.token_version != principal.token_version:
         raise HTTPException(status_code=401, detail="User not authenticated")
     
+    state["user"] = user
     return user 
\ No newline at end of file
@@ -1,22 +1,99 @@
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
+import time
 from dotenv import load_dotenv
 
+from .utils.metrics import Histogram, register_collector
+
 load_dotenv()
 
+# Synchronous URL (psycopg2), still used by Alembic migrations
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_async_database_url(url: str) -> str:
+    """Point a postgresql:// URL at the asyncpg driver"""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = get_async_database_url(SQLALCHEMY_DATABASE_URL)
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 disables
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Kept at module level so the numbers survive engine.dispose() recreating the pool
+pool_checkout_wait = Histogram()
+pool_checkout_timeouts = 0
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waits for a connection"""
+
+    def connect(self):
+        global pool_checkout_timeouts
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_checkout_timeouts += 1
+            raise
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+# expire_on_commit=False so objects stay usable after commit without an
+# implicit (and, under asyncio, illegal) lazy refresh
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
+def pool_stats() -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        # QueuePool.overflow() counts up from -pool_size; only positive values are real connections
+        "overflow": max(pool.overflow(), 0),
+        "checkout_timeouts": pool_checkout_timeouts,
+        "checkout_wait": pool_checkout_wait.snapshot(),
+    }
+
+register_collector("db_pool", pool_stats)
+
+def get_request_session(scope: dict) -> AsyncSession:
+    """
+    The session shared by everything handling an authenticated request.
+    Created on first use (many requests never need one) and closed by
+    AuthMiddleware once the response has been sent.
+    """
+    state = scope["state"]
+    db = state.get("db")
+    if db is None:
+        db = state["db"] = SessionLocal()
+    return db
+
 # Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db(request: Request):
+    # Authenticated requests reuse the request session owned by AuthMiddleware;
+    # public routes get their own
+    if "principal" in request.scope.get("state", {}):
+        yield get_request_session(request.scope)
+        return
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
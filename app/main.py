@@ -1,23 +1,53 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import json
 from dotenv import load_dotenv
 
-from .routers import auth, users, stories
+from .routers import auth, users, stories, internal
 from . import models
 from .database import engine
 from .middleware.auth import AuthMiddleware
+from .middleware.body_limit import BodyLimitMiddleware
+from .auth.cache import PRINCIPAL_CACHE_REDIS_URL, listen_for_invalidations
+from .auth.hashing import shutdown_hasher
 from .utils.cloudinary import init_cloudinary
+from .utils.follow_graph import run_follow_graph
+from .utils.media import MAX_REQUEST_BODY_BYTES, shutdown_uploader
+from .utils.like_counter import drain_like_counts, like_counts_buffered, run_like_count_flusher
+from .utils.seen_buffer import drain_seen_buffer, run_seen_flusher
+from .utils.story_expiry import STORY_EXPIRY_INTERVAL_SECONDS, run_story_expiry
 
 load_dotenv()
 
 # Initialize Cloudinary
 init_cloudinary()
 
-# Create all tables in the database
-# Comment this out if you're using Alembic for migrations
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create all tables in the database
+    # Comment this out if you're using Alembic for migrations
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    background_tasks = [asyncio.create_task(run_seen_flusher()), asyncio.create_task(run_follow_graph())]
+    if like_counts_buffered():
+        background_tasks.append(asyncio.create_task(run_like_count_flusher()))
+    if PRINCIPAL_CACHE_REDIS_URL:
+        background_tasks.append(asyncio.create_task(listen_for_invalidations()))
+    if STORY_EXPIRY_INTERVAL_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_story_expiry()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    # Write seen events and like counts still buffered before the pool goes away
+    await drain_seen_buffer()
+    await drain_like_counts()
+    shutdown_hasher()
+    shutdown_uploader()
+    await engine.dispose()
 
 API_VERSION = os.getenv("API_VERSION", "v1")
 API_PREFIX = f"/api/{API_VERSION}"
@@ -29,6 +59,7 @@ app = FastAPI(
     openapi_url=f"{API_PREFIX}/openapi.json",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Set up CORS middleware
@@ -44,10 +75,14 @@ app.add_middleware(
 # Add authentication middleware
 app.add_middleware(AuthMiddleware)
 
+# Outermost, so oversized uploads are refused before any other work
+app.add_middleware(BodyLimitMiddleware, max_body_size=MAX_REQUEST_BODY_BYTES)
+
 # Include routers
 app.include_router(auth.router, prefix=API_PREFIX + "/auth", tags=["auth"])
 app.include_router(users.router, prefix=API_PREFIX + "/users", tags=["users"])
 app.include_router(stories.router, prefix=API_PREFIX + "/stories", tags=["stories"])
+app.include_router(internal.router, prefix=API_PREFIX + "/internal", tags=["internal"], include_in_schema=False)
 
 @app.get("/")
 async def root():
@@ -1,114 +1,150 @@
-from fastapi import Request, HTTPException, status
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
-from typing import Optional, Dict, Any, Callable
+from fastapi import status
+from jose import JWTError
+from typing import Dict, Any, Callable
+import hashlib
+import json
+import logging
+import os
 import re
+import time
 
-from ..database import get_db
-from ..models import User
-from ..auth.utils import verify_token
+from ..database import get_request_session
+from ..auth.utils import decode_token, principal_from_claims, principal_from_user, REFRESH_TOKEN_TYPE
+from ..auth.cache import load_principal
+from ..utils.cache import TTLCache
+from ..utils.metrics import register_collector
+
+logger = logging.getLogger(__name__)
 
 # Paths that don't require authentication
 PUBLIC_PATHS = [
     r"^/api/v\d+/auth/login$",
     r"^/api/v\d+/auth/register$",
+    r"^/api/v\d+/auth/refresh$",
+    # Checked against INTERNAL_METRICS_TOKEN instead (app/routers/internal.py)
+    r"^/api/v\d+/internal/",
     r"/docs$",
     r"/redoc$",
     r"^/api/v\d+/openapi.json$",
     r"/$",
 ]
+# Matched from the start of the path, like re.match on each pattern
+PUBLIC_PATH_PATTERN = re.compile("|".join(f"(?:{pattern})" for pattern in PUBLIC_PATHS))
+
+# Decoded token claims memoized by token digest until the token's own expiry
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+token_cache = TTLCache(TOKEN_CACHE_SIZE, ttl=0)
+register_collector("token_cache", token_cache.stats)
+
+def _error_response(status_code: int, detail: str):
+    """Prebuild the ASGI messages of a static JSON error response"""
+    body = json.dumps({"detail": detail}).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"www-authenticate", b"Bearer"),
+    ]
+    return (
+        {"type": "http.response.start", "status": status_code, "headers": headers},
+        {"type": "http.response.body", "body": body},
+    )
+
+NOT_AUTHENTICATED = _error_response(status.HTTP_401_UNAUTHORIZED, "Not authenticated")
+INVALID_TOKEN = _error_response(status.HTTP_401_UNAUTHORIZED, "Invalid token")
+INVALID_CREDENTIALS = _error_response(status.HTTP_401_UNAUTHORIZED, "Invalid authentication credentials")
+USER_NOT_FOUND = _error_response(status.HTTP_401_UNAUTHORIZED, "User not found")
+
+async def _send_error(send: Callable, response) -> None:
+    start, body = response
+    await send(start)
+    await send(body)
+
+def _authenticate_token(token: bytes):
+    """
+    Decode a bearer token into (token, claims, principal), reusing the result
+    for repeated tokens. None if the token is invalid or expired.
+    """
+    digest = hashlib.blake2b(token, digest_size=16).digest()
+    entry = token_cache.get(digest)
+    if entry is not None:
+        return entry
+    token_str = token.decode("latin-1")
+    try:
+        payload = decode_token(token_str)
+    except JWTError as je:
+        logger.debug("JWT Error: %s", je)
+        return None
+    entry = (token_str, payload, principal_from_claims(payload))
+    # Only cache tokens that carry an expiry, and only until then
+    expires_at = payload.get("exp")
+    if isinstance(expires_at, (int, float)):
+        token_cache.set(digest, entry, ttl=expires_at - time.time())
+    return entry
 
 class AuthMiddleware:
+    """
+    Raw ASGI authentication. Per request it does one regex match on the path,
+    scans the raw headers for authorization only, and decodes a given token
+    at most once until it expires.
+    """
+
     def __init__(self, app):
         self.app = app
 
     async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
-        if scope["type"] != "http":
-            # If it's not an HTTP request (e.g., WebSocket), just pass it through
+        # Non-HTTP requests (e.g., WebSocket), CORS preflights and public paths pass through
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or PUBLIC_PATH_PATTERN.match(scope["path"])
+        ):
             await self.app(scope, receive, send)
             return
 
-        # Create a request object
-        request = Request(scope)
-        path = request.url.path
-        
-        # Allow OPTIONS requests to pass through for CORS
-        if request.method == "OPTIONS":
-            await self.app(scope, receive, send)
+        # ASGI servers lowercase header names
+        auth_header = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth_header = value
+                break
+
+        # Check if token is present and valid
+        if auth_header is None or not auth_header.startswith(b"Bearer "):
+            await _send_error(send, NOT_AUTHENTICATED)
             return
-        
-        # Skip authentication for public paths
-        if any(re.match(pattern, path) for pattern in PUBLIC_PATHS):
-            await self.app(scope, receive, send)
+
+        entry = _authenticate_token(auth_header[7:])
+        if entry is None:
+            await _send_error(send, INVALID_CREDENTIALS)
             return
-        
-        # Extract headers for logging
-        headers = {k.decode().lower(): v.decode() for k, v in scope.get('headers', [])}
-        auth_header = headers.get('authorization')
-        
-        # Check if token is present and valid
-        if not auth_header or not auth_header.startswith("Bearer "):
-            print("No valid authorization header found")
-            response = JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Not authenticated"},
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-            await response(scope, receive, send)
+        token, payload, principal = entry
+        # Refresh tokens are only accepted by /auth/refresh
+        if "sub" not in payload or payload.get("type") == REFRESH_TOKEN_TYPE:
+            await _send_error(send, INVALID_TOKEN)
             return
-        
-        token = auth_header.replace("Bearer ", "")
-        
-        try:
-            # Verify token and get payload
-            payload = verify_token(token)
-            if not payload or "sub" not in payload:
-                print("Token payload invalid")
-                response = JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={"detail": "Invalid token"},
-                    headers={"WWW-Authenticate": "Bearer"}
-                )
-                await response(scope, receive, send)
-                return
-            
-            # Get user email from token
-            email = payload.get("sub")
-            
-            # Get database session
-            db = next(get_db())
-            
-            # Get user from database
-            user = db.query(User).filter(User.email == email).first()
+
+        if principal is not None:
+            # Versioned tokens carry everything needed to identify the
+            # caller; the user row is only loaded if a handler asks for it
+            state = scope["state"] = {"principal": principal, "token": token}
+        else:
+            # Legacy token with just the email: look the user up
+            state = scope["state"] = {"token": token}
+            user = await load_principal(get_request_session(scope), payload["sub"])
             if user is None:
-                print(f"No user found with email: {email}")
-                response = JSONResponse(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    content={"detail": "User not found"},
-                    headers={"WWW-Authenticate": "Bearer"}
-                )
-                await response(scope, receive, send)
+                await state["db"].close()
+                await _send_error(send, USER_NOT_FOUND)
                 return
-            
+
             # Add user to request state
-            scope["state"] = {"user": user, "token": token}
-            print(f"User authenticated: {user.email}")
-            
+            state["user"] = user
+            state["principal"] = principal_from_user(user)
+
+        # One session per request: created lazily by get_request_session, shared
+        # by the route handlers through get_db, and closed once the response is sent
+        try:
             await self.app(scope, receive, send)
-            
-        except JWTError as je:
-            print(f"JWT Error: {str(je)}")
-            response = JSONResponse(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                content={"detail": "Invalid authentication credentials"},
-                headers={"WWW-Authenticate": "Bearer"}
-            )
-            await response(scope, receive, send)
-        except Exception as e:
-            print(f"Unexpected error: {str(e)}")
-            response = JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={"detail": str(e)}
-            )
-            await response(scope, receive, send) 
\ No newline at end of file
+        finally:
+            db = state.get("db")
+            if db is not None:
+                await db.close()
@@ -0,0 +1,60 @@
+from fastapi import HTTPException, status
+from typing import Any, Callable, Dict
+import json
+
+TOO_LARGE_DETAIL = "Request body too large"
+
+_body = json.dumps({"detail": TOO_LARGE_DETAIL}).encode()
+TOO_LARGE = (
+    {
+        "type": "http.response.start",
+        "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(_body)).encode()),
+            # The rest of the body is never read, so the connection can't be reused
+            (b"connection", b"close"),
+        ],
+    },
+    {"type": "http.response.body", "body": _body},
+)
+
+class BodyLimitMiddleware:
+    """
+    Raw ASGI request body cap. A Content-Length over the limit gets a 413
+    before any of the body is read; otherwise the body is counted as the app
+    receives it, so a chunked upload is cut off as soon as it passes the limit
+    instead of being spooled to the end.
+    """
+
+    def __init__(self, app, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_body_size:
+                    start, body = TOO_LARGE
+                    await send(start)
+                    await send(body)
+                    return
+                break
+        
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    # FastAPI passes HTTPExceptions from body parsing through unchanged
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=TOO_LARGE_DETAIL)
+            return message
+        
+        await self.app(scope, limited_receive, send)
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, String, DateTime, Boolean, Integer, ForeignKey, Table, ARRAY
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, BigInteger, SmallInteger, Identity, ForeignKey, Table, Index, ARRAY
 from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy.sql import func
+from sqlalchemy.sql import and_, func
 from sqlalchemy.orm import relationship
 import uuid
 
@@ -9,12 +9,24 @@ from .database import Base
 # Association tables for many-to-many relationships
 user_followers = Table('user_followers', Base.metadata,
     Column('follower_id', UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True),
-    Column('followed_id', UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True)
+    Column('followed_id', UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True),
+    # The primary key only serves follower -> followed lookups; this is the reverse
+    Index('ix_user_followers_followed_id_follower_id', 'followed_id', 'follower_id')
 )
 
 user_liked_stories = Table('user_liked_stories', Base.metadata,
     Column('user_id', UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True),
-    Column('story_id', UUID(as_uuid=True), ForeignKey('stories.id'), primary_key=True)
+    Column('story_id', UUID(as_uuid=True), ForeignKey('stories.id'), primary_key=True),
+    Index('ix_user_liked_stories_story_id', 'story_id')
+)
+
+# Likes (+1) and unlikes (-1) not yet added to stories.likes_count. Inserted in
+# the like's own transaction and merged in batches (see app/utils/like_counter.py),
+# so likes of one story don't queue on its row lock and a crash loses none.
+story_like_deltas = Table('story_like_deltas', Base.metadata,
+    Column('id', BigInteger, Identity(), primary_key=True),
+    Column('story_id', UUID(as_uuid=True), ForeignKey('stories.id'), nullable=False),
+    Column('delta', SmallInteger, nullable=False)
 )
 
 user_seen_stories = Table('user_seen_stories', Base.metadata,
@@ -22,10 +34,31 @@ user_seen_stories = Table('user_seen_stories', Base.metadata,
     Column('story_id', UUID(as_uuid=True), ForeignKey('stories.id'), primary_key=True),
     Column('seen_at', DateTime(timezone=True), server_default=func.now())
 )
+# A story's viewers, most recent first (GET /stories/{id}/viewers)
+Index(
+    'ix_user_seen_stories_story_id_seen_at',
+    user_seen_stories.c.story_id, user_seen_stories.c.seen_at.desc(), user_seen_stories.c.user_id.desc()
+)
+
+# Materialized home feed: one row per (reader, story), written when a story is
+# posted (see app/utils/feed.py). created_at copies the story's so a page of the
+# feed is a single range scan of the index below.
+feed_items = Table('feed_items', Base.metadata,
+    Column('user_id', UUID(as_uuid=True), ForeignKey('users.id'), primary_key=True),
+    Column('story_id', UUID(as_uuid=True), ForeignKey('stories.id'), primary_key=True),
+    Column('author_id', UUID(as_uuid=True), ForeignKey('users.id'), nullable=False),
+    Column('created_at', DateTime(timezone=True), nullable=False)
+)
+Index(
+    'ix_feed_items_user_id_created_at',
+    feed_items.c.user_id, feed_items.c.created_at.desc(), feed_items.c.story_id.desc()
+)
+# Removing a story's rows from every feed (the expiry sweep)
+Index('ix_feed_items_story_id', feed_items.c.story_id)
 
 class User(Base):
     __tablename__ = "users"
-
+    
     id = Column(UUID(as_uuid=True), primary_key=True, index=True, default=uuid.uuid4)
     email = Column(String, unique=True, index=True)
     username = Column(String, unique=True, index=True)
@@ -34,9 +67,19 @@ class User(Base):
     bio = Column(String, nullable=True)
     birthday = Column(DateTime, nullable=True)
     profile_picture = Column(String, nullable=True)
+    # Bumped to revoke every refresh token issued so far
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Maintained by follow/unfollow; followers_count also decides whether new
+    # stories are fanned out
+    followers_count = Column(Integer, nullable=False, default=0, server_default="0")
+    following_count = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Fetch server-generated timestamps with RETURNING on flush, so they never
+    # need a lazy refresh (which AsyncSession cannot do implicitly)
+    __mapper_args__ = {"eager_defaults": True}
+    
     # Relationships
     stories = relationship("Story", back_populates="user")
     following = relationship(
@@ -49,6 +92,17 @@ class User(Base):
     liked_stories = relationship("Story", secondary=user_liked_stories, back_populates="liked_by")
     seen_stories = relationship("Story", secondary=user_seen_stories, back_populates="seen_by")
 
+# Typeahead search (app/utils/user_search.py): text_pattern_ops compares bytes,
+# so a prefix is one range scan that already returns its matches sorted
+Index(
+    'ix_users_username_prefix', func.lower(User.username).label('username_lower'),
+    postgresql_ops={'username_lower': 'text_pattern_ops'}
+)
+Index(
+    'ix_users_fullname_prefix', func.lower(User.fullname).label('fullname_lower'),
+    postgresql_ops={'fullname_lower': 'text_pattern_ops'}
+)
+
 class Story(Base):
     __tablename__ = "stories"
     
@@ -58,9 +112,31 @@ class Story(Base):
     caption = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
     likes_count = Column(Integer, default=0)
+    # Maintained by the seen event flush, so viewer counts need no COUNT(*)
+    seen_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Whether the story was written into followers' feeds when posted; if
+    # not, the feed merges it at read time (see app/utils/feed.py)
+    fanned_out = Column(Boolean, nullable=False, default=True, server_default="true")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    __mapper_args__ = {"eager_defaults": True}
+    __table_args__ = (
+        # Author's stories newest first (/stories/me) and the feed's active-only variant
+        Index('ix_stories_user_id_created_at', 'user_id', created_at.desc(), id.desc()),
+        Index(
+            'ix_stories_active_user_id_created_at', 'user_id', created_at.desc(), id.desc(),
+            postgresql_where=(is_active == True)
+        ),
+        # Feed read-time merge of live stories that were not fanned out
+        Index(
+            'ix_stories_active_not_fanned_out_user_id_created_at', 'user_id', created_at.desc(), id.desc(),
+            postgresql_where=and_(is_active == True, fanned_out == False)
+        ),
+        # The expiry sweeper's scan for active stories past their TTL
+        Index('ix_stories_active_created_at', 'created_at', postgresql_where=(is_active == True)),
+    )
+    
     # Relationships
     user = relationship("User", back_populates="stories")
     liked_by = relationship("User", secondary=user_liked_stories, back_populates="liked_stories")
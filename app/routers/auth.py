@@ -1,29 +1,33 @@
-from datetime import timedelta
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID
 
 from .. import models, schemas
 from ..database import get_db
 from ..auth.utils import (
-    verify_password,
-    get_password_hash,
-    create_access_token,
-    ACCESS_TOKEN_EXPIRE_MINUTES,
-    get_current_user_from_request
+    verify_token,
+    create_user_tokens,
+    get_current_user_from_request,
+    get_current_principal,
+    REFRESH_TOKEN_TYPE
 )
+from ..auth.cache import invalidate_principal
+from ..auth.hashing import hash_password, check_password_and_update
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
 @router.post("/register", response_model=schemas.User)
-async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
-    db_user = db.query(models.User).filter(
+    result = await db.execute(select(models.User).where(
         (models.User.email == user.email) | 
         (models.User.username == user.username)
-    ).first()
+    ))
+    db_user = result.scalars().first()
     if db_user:
         raise HTTPException(
             status_code=400,
@@ -31,24 +35,24 @@ async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     db_user = models.User(
         email=user.email,
         username=user.username,
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     return db_user
 
 @router.post("/login", response_model=schemas.Token)
 async def login(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Find user by email
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
+    result = await db.execute(select(models.User).where(models.User.email == form_data.username))
+    user = result.scalars().first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -57,22 +61,60 @@ async def login(
         )
     
     # Verify password
-    if not verify_password(form_data.password, user.hashed_password):
+    verified, new_hash = await check_password_and_update(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Create access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+    # Transparently move the stored hash to the configured bcrypt cost
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        await invalidate_principal(user.email)
+    
+    # Create access and refresh tokens
+    return create_user_tokens(user)
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh(body: schemas.TokenRefresh, db: AsyncSession = Depends(get_db)):
+    """Exchange a refresh token for a new access/refresh token pair"""
+    payload = verify_token(body.refresh_token)
+    if payload.get("type") != REFRESH_TOKEN_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # The only database read in the token lifecycle: revocation check
+    user = await db.get(models.User, UUID(payload["uid"]))
+    if user is None or user.token_version != payload.get("tv"):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return create_user_tokens(user)
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: Request, db: AsyncSession = Depends(get_db)):
+    """Revoke every refresh token of the current user; access tokens simply expire"""
+    principal = get_current_principal(request)
+    await db.execute(
+        update(models.User)
+        .where(models.User.id == principal.id)
+        .values(token_version=models.User.token_version + 1)
     )
-    return {"access_token": access_token, "token_type": "bearer"}
+    await db.commit()
+    await invalidate_principal(principal.email)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.get("/check-session", response_model=schemas.User)
 async def check_session(request: Request):
     """Check if the user's session is valid and return the user information"""
-    current_user = get_current_user_from_request(request)
+    current_user = await get_current_user_from_request(request)
     return current_user 
\ No newline at end of file
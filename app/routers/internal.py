@@ -0,0 +1,28 @@
+import os
+import secrets
+from typing import Optional
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from ..utils.metrics import collect
+
+load_dotenv()
+
+# Operations credential for the internal endpoints, separate from user logins;
+# unset disables them
+INTERNAL_METRICS_TOKEN = os.getenv("INTERNAL_METRICS_TOKEN")
+
+def require_internal_token(x_internal_token: Optional[str] = Header(None)) -> None:
+    if not INTERNAL_METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_internal_token is None or not secrets.compare_digest(
+        x_internal_token.encode(), INTERNAL_METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid internal token")
+
+router = APIRouter(dependencies=[Depends(require_internal_token)])
+
+@router.get("/metrics")
+async def get_metrics():
+    """Live runtime metrics (connection pool, caches, worker pools) for capacity tuning"""
+    return collect()
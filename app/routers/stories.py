@@ -1,26 +1,119 @@
-from typing import Annotated, List
-from fastapi import APIRouter, Depends, HTTPException, status, Request, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from datetime import datetime, timezone
+from typing import Annotated, Collection, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Request, UploadFile, File, Form, Query
+from sqlalchemy import and_, delete, func, literal, select, Select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, contains_eager
 from uuid import UUID
 
 from .. import models, schemas
 from ..database import get_db
-from ..auth.utils import get_current_user_from_request
-from ..utils.cloudinary import upload_media
+from ..auth.utils import get_current_user_from_request, get_current_principal
+from ..utils.media import upload_media
+from ..utils.feed import fan_out_story, feed_page_ids, should_fan_out
+from ..utils.like_counter import commit_like_delta, like_counts_buffered, merge_pending_likes
+from ..utils.pagination import decode_cursor, keyset_after, paginate
+from ..utils.seen_buffer import is_seen_pending, pending_seen_story_ids, record_seen, record_seen_rows
+from ..utils.story_expiry import live_stories
 
 router = APIRouter()
 
+# Viewers shown with a story; the full list is paged by /{story_id}/viewers
+VIEWERS_PREVIEW_SIZE = 3
+
+def story_query(story_id: UUID):
+    return select(models.Story).where(models.Story.id == story_id)
+
+async def _get_story(db: AsyncSession, story_id: UUID, *collections) -> models.Story:
+    """Load a story with its author and the given collections, or raise 404"""
+    result = await db.execute(
+        story_query(story_id)
+        .options(selectinload(models.Story.user), *(selectinload(c) for c in collections))
+    )
+    story = result.scalars().first()
+    if story is None:
+        raise HTTPException(status_code=404, detail="Story not found")
+    merge_pending_likes([story])
+    return story
+
+async def _story_exists(db: AsyncSession, story_id: UUID) -> bool:
+    return await db.scalar(select(models.Story.id).where(models.Story.id == story_id)) is not None
+
+def has_seen_query(user_id: UUID, story_id: UUID):
+    """One primary key lookup in user_seen_stories"""
+    return select(models.user_seen_stories.c.story_id).where(
+        models.user_seen_stories.c.user_id == user_id,
+        models.user_seen_stories.c.story_id == story_id
+    )
+
+async def _has_seen(db: AsyncSession, user_id: UUID, story_id: UUID) -> bool:
+    result = await db.execute(has_seen_query(user_id, story_id))
+    return result.first() is not None
+
+def viewer_state_query(user_id: UUID, story_ids: List[UUID]):
+    """Which of the stories the user liked (True) or saw (False), in one query over both association tables"""
+    liked, seen = models.user_liked_stories, models.user_seen_stories
+    return union_all(
+        select(liked.c.story_id, literal(True)).where(liked.c.user_id == user_id, liked.c.story_id.in_(story_ids)),
+        select(seen.c.story_id, literal(False)).where(seen.c.user_id == user_id, seen.c.story_id.in_(story_ids))
+    )
+
+async def _with_viewer_state(db: AsyncSession, user_id: UUID, stories) -> List[schemas.FeedStory]:
+    """
+    Add liked_by_me and seen_by_me to a page of stories, from one query over
+    both association tables for the page's ids
+    """
+    items = [schemas.FeedStory.model_validate(story) for story in stories]
+    if not items:
+        return items
+    result = await db.execute(viewer_state_query(user_id, [item.id for item in items]))
+    liked_ids, seen_ids = set(), pending_seen_story_ids(user_id)
+    for story_id, is_like in result.all():
+        (liked_ids if is_like else seen_ids).add(story_id)
+    for item in items:
+        item.liked_by_me = item.id in liked_ids
+        item.seen_by_me = item.id in seen_ids
+    return items
+
+def is_following_query(follower_id: UUID, followed_id: UUID):
+    """One primary key lookup in user_followers"""
+    return select(models.user_followers.c.followed_id).where(
+        models.user_followers.c.follower_id == follower_id,
+        models.user_followers.c.followed_id == followed_id
+    )
+
+async def _is_following(db: AsyncSession, follower_id: UUID, followed_id: UUID) -> bool:
+    result = await db.execute(is_following_query(follower_id, followed_id))
+    return result.first() is not None
+
+def _decode_story_cursor(cursor: Optional[str]) -> Optional[tuple]:
+    return decode_cursor(cursor, datetime.fromisoformat, UUID) if cursor else None
+
+def story_page_query(query: Select, after: Optional[tuple], limit: int) -> Select:
+    """`limit` stories of a story list query after the cursor, newest first, keyed on (created_at, id)"""
+    if after is not None:
+        query = query.where(keyset_after((models.Story.created_at, models.Story.id), after))
+    return query.order_by(models.Story.created_at.desc(), models.Story.id.desc()).limit(limit)
+
+async def _story_page(db: AsyncSession, query: Select, cursor: Optional[str], limit: int) -> dict:
+    """Run a story list query as one keyset page"""
+    result = await db.execute(story_page_query(query, _decode_story_cursor(cursor), limit + 1))
+    stories = result.scalars().all()
+    merge_pending_likes(stories)
+    return paginate(stories, limit, lambda story: (story.created_at, story.id))
+
 @router.post("/", response_model=schemas.Story)
 async def create_story(
     request: Request,
     media_file: UploadFile = File(...),
     caption: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Create a new story with media upload"""
-    current_user = get_current_user_from_request(request)
+    current_user = get_current_principal(request)
     
-    # Upload media to Cloudinary
+    # Checks the type and size limits, then streams the file to storage off the event loop
     media_url = await upload_media(media_file)
     if not media_url:
         raise HTTPException(
@@ -32,145 +125,308 @@ async def create_story(
     new_story = models.Story(
         media_url=media_url,
         caption=caption,
-        user_id=current_user.id
+        user_id=current_user.id,
+        fanned_out=should_fan_out(current_user.id)
     )
     
     db.add(new_story)
-    db.commit()
-    db.refresh(new_story)
-    return new_story
+    # Flush first: the fan-out needs the story's id and the server-side
+    # created_at and fanned_out
+    await db.flush()
+    await fan_out_story(db, new_story)
+    await db.commit()
+    return await _get_story(db, new_story.id)
+
+def feed_query(user_id: UUID, after: Optional[tuple], limit: int) -> Select:
+    """
+    A user's home feed for story_page_query. The page's story ids come from
+    the materialized feed (plus stories that were not fanned out, merged at
+    read time), then are joined with stories and authors.
+    """
+    page_ids = feed_page_ids(user_id, after, limit)
+    return (
+        select(models.Story)
+        .join(page_ids, page_ids.c.story_id == models.Story.id)
+        .join(models.Story.user)
+        .options(contains_eager(models.Story.user))
+    )
 
-@router.get("/", response_model=List[schemas.Story])
+@router.get("/", response_model=schemas.Page[schemas.FeedStory])
 async def get_stories(
     request: Request,
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get stories from users the current user follows and their own stories"""
-    current_user = get_current_user_from_request(request)
-    
-    # Get IDs of users the current user follows
-    following_ids = [user.id for user in current_user.following]
-    following_ids.append(current_user.id)  # Include own stories
-    
-    # Query stories from those users
-    stories = db.query(models.Story).filter(
-        models.Story.user_id.in_(following_ids),
-        models.Story.is_active == True
-    ).order_by(models.Story.created_at.desc()).offset(skip).limit(limit).all()
+    current_user = get_current_principal(request)
     
-    return stories
+    query = feed_query(current_user.id, _decode_story_cursor(cursor), limit + 1)
+    page = await _story_page(db, query, cursor, limit)
+    page["items"] = await _with_viewer_state(db, current_user.id, page["items"])
+    return page
 
-@router.get("/me", response_model=List[schemas.Story])
+def my_stories_query(user_id: UUID) -> Select:
+    """A user's own stories, with authors, for story_page_query"""
+    return (
+        select(models.Story)
+        .join(models.Story.user)
+        .options(contains_eager(models.Story.user))
+        .where(models.Story.user_id == user_id)
+    )
+
+@router.get("/me", response_model=schemas.Page[schemas.Story])
 async def get_my_stories(
     request: Request,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all stories created by the current user"""
-    current_user = get_current_user_from_request(request)
+    current_user = get_current_principal(request)
+    return await _story_page(db, my_stories_query(current_user.id), cursor, limit)
+
+def tray_query(user_id: UUID, pending_seen: Collection[UUID], limit: int):
+    """
+    One aggregate over the followed authors' live stories; the outer join
+    finds the ones the user has not seen. Seen events still in the
+    write-behind buffer (`pending_seen`) count as seen too.
+    """
+    seen = models.user_seen_stories
+    latest_story_at = func.max(models.Story.created_at).label("latest_story_at")
+    unseen = seen.c.story_id.is_(None)
+    if pending_seen:
+        unseen = and_(unseen, models.Story.id.not_in(pending_seen))
+    has_unseen = func.bool_or(unseen).label("has_unseen")
+    return (
+        select(models.User, latest_story_at, func.count(models.Story.id), has_unseen)
+        .select_from(models.user_followers)
+        .join(models.User, models.User.id == models.user_followers.c.followed_id)
+        .join(models.Story, models.Story.user_id == models.User.id)
+        .outerjoin(seen, and_(seen.c.story_id == models.Story.id, seen.c.user_id == user_id))
+        .where(models.user_followers.c.follower_id == user_id, live_stories())
+        .group_by(models.User.id)
+        .order_by(has_unseen.desc(), latest_story_at.desc(), models.User.id)
+        .limit(limit)
+    )
+
+@router.get("/tray", response_model=List[schemas.StoryTrayEntry])
+async def get_story_tray(
+    request: Request,
+    limit: int = Query(100, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Followed authors with live stories, one entry each: authors with unseen
+    stories first, then by their latest story
+    """
+    current_user = get_current_principal(request)
     
-    stories = db.query(models.Story).filter(
-        models.Story.user_id == current_user.id
-    ).order_by(models.Story.created_at.desc()).all()
+    result = await db.execute(tray_query(current_user.id, pending_seen_story_ids(current_user.id), limit))
+    return [
+        {"user": user, "latest_story_at": latest, "story_count": count, "has_unseen": unseen}
+        for user, latest, count, unseen in result.all()
+    ]
+
+def existing_stories_query(story_ids: Collection[UUID]):
+    return select(models.Story.id).where(models.Story.id.in_(story_ids))
+
+@router.post("/seen", response_model=schemas.StorySeenBatchResult)
+async def mark_stories_as_seen(
+    batch: schemas.StorySeenBatch,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Mark several stories as seen at once, e.g. after auto-advancing through the tray"""
+    current_user = get_current_principal(request)
     
-    return stories
+    result = await db.execute(existing_stories_query(batch.story_ids))
+    story_ids = result.scalars().all()
+    # Written now in one multi-row insert, rather than through the buffer
+    seen_at = datetime.now(timezone.utc)
+    await record_seen_rows(db, (
+        {"user_id": current_user.id, "story_id": story_id, "seen_at": seen_at} for story_id in story_ids
+    ))
+    await db.commit()
+    return {"story_ids": story_ids}
+
+def recent_viewers_query(story_id: UUID, limit: int):
+    """A story's most recent viewers, for the preview on the story"""
+    seen = models.user_seen_stories
+    return (
+        select(models.User)
+        .join(seen, seen.c.user_id == models.User.id)
+        .where(seen.c.story_id == story_id)
+        .order_by(seen.c.seen_at.desc(), seen.c.user_id.desc())
+        .limit(limit)
+    )
 
-@router.get("/{story_id}", response_model=schemas.StoryWithSeenBy)
+@router.get("/{story_id}", response_model=schemas.StoryDetail)
 async def get_story(
     story_id: UUID,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Get a specific story by ID"""
-    current_user = get_current_user_from_request(request)
+    """Get a specific story with its viewer count and most recent viewers"""
+    current_user = await get_current_user_from_request(request)
     
-    story = db.query(models.Story).filter(models.Story.id == story_id).first()
-    if story is None:
-        raise HTTPException(status_code=404, detail="Story not found")
+    story = await _get_story(db, story_id)
+    result = await db.execute(recent_viewers_query(story_id, VIEWERS_PREVIEW_SIZE))
+    response = schemas.StoryDetail.model_validate({
+        **schemas.Story.model_validate(story).model_dump(),
+        "seen_count": story.seen_count,
+        "recent_viewers": result.scalars().all(),
+    })
+    
+    # Mark story as seen by current user if not already seen, when it is by
+    # someone the user follows or their own. The write is buffered, so count
+    # the view in this response directly.
+    if await _has_seen(db, current_user.id, story.id):
+        return response
+    if is_seen_pending(current_user.id, story.id) or (
+        story.user_id == current_user.id or await _is_following(db, current_user.id, story.user_id)
+    ):
+        record_seen(current_user.id, story.id)
+        response.seen_count += 1
+        response.recent_viewers = [
+            schemas.UserPublic.model_validate(current_user), *response.recent_viewers
+        ][:VIEWERS_PREVIEW_SIZE]
     
-    # Mark story as seen by current user if not already seen
-    if current_user not in story.seen_by:
-        # Check if the story is by someone the user follows or their own
-        if story.user_id == current_user.id or story.user in current_user.following:
-            story.seen_by.append(current_user)
-            db.commit()
+    return response
+
+def viewers_page_query(story_id: UUID, after: Optional[tuple], limit: int):
+    """`limit` viewers of a story after the cursor, most recent first, keyed on (seen_at, user_id)"""
+    seen = models.user_seen_stories
+    query = (
+        select(models.User, seen.c.seen_at)
+        .join(seen, seen.c.user_id == models.User.id)
+        .where(seen.c.story_id == story_id)
+    )
+    if after is not None:
+        query = query.where(keyset_after((seen.c.seen_at, seen.c.user_id), after))
+    return query.order_by(seen.c.seen_at.desc(), seen.c.user_id.desc()).limit(limit)
+
+@router.get("/{story_id}/viewers", response_model=schemas.Page[schemas.StoryViewer])
+async def get_story_viewers(
+    story_id: UUID,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Users who have seen a story, most recent first. Paginated like the feed."""
+    if not await _story_exists(db, story_id):
+        raise HTTPException(status_code=404, detail="Story not found")
     
+    after = decode_cursor(cursor, datetime.fromisoformat, UUID) if cursor else None
+    result = await db.execute(viewers_page_query(story_id, after, limit + 1))
+    page = paginate(result.all(), limit, lambda row: (row.seen_at, row.User.id))
+    page["items"] = [{"user": row.User, "seen_at": row.seen_at} for row in page["items"]]
+    return page
+
+def like_insert(user_id: UUID, story_id: UUID):
+    """
+    Insert a like, returning its story id, or nothing if the story is already
+    liked or does not exist. The primary key makes a repeated like a no-op,
+    even for concurrent requests; selecting from stories means a missing
+    story inserts nothing either.
+    """
+    return (
+        pg_insert(models.user_liked_stories)
+        .from_select(
+            ["user_id", "story_id"],
+            select(literal(user_id, models.User.id.type), models.Story.id).where(models.Story.id == story_id)
+        )
+        .on_conflict_do_nothing()
+        .returning(models.user_liked_stories.c.story_id)
+    )
+
+def like_delete(user_id: UUID, story_id: UUID):
+    """Delete a like, returning its story id, or nothing if there was none"""
+    return (
+        delete(models.user_liked_stories)
+        .where(
+            models.user_liked_stories.c.user_id == user_id,
+            models.user_liked_stories.c.story_id == story_id
+        )
+        .returning(models.user_liked_stories.c.story_id)
+    )
+
+def likes_count_update(story_id: UUID, delta: int):
+    """Atomic likes_count adjustment returning the updated story"""
+    return (
+        update(models.Story)
+        .where(models.Story.id == story_id)
+        .values(likes_count=models.Story.likes_count + delta, updated_at=models.Story.updated_at)
+        .returning(models.Story)
+    )
+
+async def _raise_missing_or(db: AsyncSession, story_id: UUID, detail: str):
+    """A like write matched no row: 404 if the story does not exist, else 400 with `detail`"""
+    if not await _story_exists(db, story_id):
+        raise HTTPException(status_code=404, detail="Story not found")
+    raise HTTPException(status_code=400, detail=detail)
+
+async def _count_like(db: AsyncSession, story_id: UUID, delta: int) -> models.Story:
+    """
+    Commit the like or unlike and adjust likes_count: as a delta row merged
+    later if buffering is enabled, otherwise atomically on the row. Returns
+    the updated story with its author.
+    """
+    if like_counts_buffered():
+        await commit_like_delta(db, story_id, delta)
+        return await _get_story(db, story_id)
+    result = await db.execute(
+        select(models.Story)
+        .from_statement(likes_count_update(story_id, delta))
+        .options(selectinload(models.Story.user))
+        .execution_options(populate_existing=True)
+    )
+    story = result.scalars().one()
+    await db.commit()
     return story
 
 @router.post("/{story_id}/like", response_model=schemas.Story)
 async def like_story(
     story_id: UUID,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Like a story"""
-    current_user = get_current_user_from_request(request)
-    
-    # Get story
-    story = db.query(models.Story).filter(models.Story.id == story_id).first()
-    if story is None:
-        raise HTTPException(status_code=404, detail="Story not found")
+    current_user = get_current_principal(request)
     
-    # Check if already liked
-    if current_user in story.liked_by:
-        raise HTTPException(status_code=400, detail="Already liked this story")
+    liked = await db.execute(like_insert(current_user.id, story_id))
+    if liked.first() is None:
+        await _raise_missing_or(db, story_id, "Already liked this story")
     
-    # Add like
-    story.liked_by.append(current_user)
-    story.likes_count += 1
-    
-    db.commit()
-    db.refresh(story)
-    return story
+    return await _count_like(db, story_id, 1)
 
 @router.delete("/{story_id}/unlike", response_model=schemas.Story)
 async def unlike_story(
     story_id: UUID,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Remove like from a story"""
-    current_user = get_current_user_from_request(request)
-    
-    # Get story
-    story = db.query(models.Story).filter(models.Story.id == story_id).first()
-    if story is None:
-        raise HTTPException(status_code=404, detail="Story not found")
-    
-    # Check if actually liked
-    if current_user not in story.liked_by:
-        raise HTTPException(status_code=400, detail="Not liked this story")
+    current_user = get_current_principal(request)
     
-    # Remove like
-    story.liked_by.remove(current_user)
-    story.likes_count -= 1
+    unliked = await db.execute(like_delete(current_user.id, story_id))
+    if unliked.first() is None:
+        await _raise_missing_or(db, story_id, "Not liked this story")
     
-    db.commit()
-    db.refresh(story)
-    return story
+    return await _count_like(db, story_id, -1)
 
 @router.post("/{story_id}/seen", response_model=schemas.Story)
 async def mark_story_as_seen(
     story_id: UUID,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Explicitly mark a story as seen by the current user"""
-    current_user = get_current_user_from_request(request)
+    current_user = get_current_principal(request)
     
     # Get story
-    story = db.query(models.Story).filter(models.Story.id == story_id).first()
-    if story is None:
-        raise HTTPException(status_code=404, detail="Story not found")
-    
-    # Check if already seen
-    if current_user in story.seen_by:
-        return story
+    story = await _get_story(db, story_id)
     
-    # Add to seen by
-    story.seen_by.append(current_user)
-    
-    db.commit()
-    db.refresh(story)
-    return story 
\ No newline at end of file
+    # Buffered and written in bulk; repeats are ignored
+    record_seen(current_user.id, story.id)
+    return story
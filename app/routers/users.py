@@ -1,11 +1,19 @@
-from typing import Annotated, List
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from sqlalchemy import Integer, column, delete, literal, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
 from .. import models, schemas
 from ..database import get_db
-from ..auth.utils import get_current_user_from_request
+from ..auth.utils import get_current_user_from_request, get_current_principal
+from ..auth.cache import invalidate_principal
+from ..utils.feed import backfill_author_stories, prune_author_stories
+from ..utils.follow_graph import record_follow, record_unfollow, suggest_follows
+from ..utils.pagination import decode_cursor, encode_cursor, keyset_after, paginate
+from ..utils.user_columns import PUBLIC_USER_COLUMNS
+from ..utils.user_search import USER_SEARCH_MAX_RESULTS, search_users
 
 router = APIRouter()
 
@@ -13,10 +21,10 @@ router = APIRouter()
 async def update_profile(
     profile_data: schemas.ProfileUpdate,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update the current user's profile information"""
-    current_user = get_current_user_from_request(request)
+    current_user = await get_current_user_from_request(request)
     
     # Update user fields if they are provided
     if profile_data.fullname is not None:
@@ -28,86 +36,312 @@ async def update_profile(
     if profile_data.profile_picture is not None:
         current_user.profile_picture = profile_data.profile_picture
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await invalidate_principal(current_user.email)
     return current_user
 
 @router.get("/me", response_model=schemas.User)
 async def get_current_user_profile(request: Request):
     """Get the current user's profile information"""
-    return get_current_user_from_request(request)
+    return await get_current_user_from_request(request)
+
+@router.get("/", response_model=List[schemas.UserPublic])
+async def get_user_profiles(
+    ids: List[UUID] = Query(..., max_length=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Public profiles of several users in one query, in the order asked for.
+    Unknown ids are left out.
+    """
+    result = await db.execute(select(*PUBLIC_USER_COLUMNS).where(models.User.id.in_(ids)))
+    users = {user.id: user for user in result.all()}
+    return [users[user_id] for user_id in dict.fromkeys(ids) if user_id in users]
+
+@router.get("/search", response_model=schemas.Page[schemas.UserPublic])
+async def search_user_profiles(
+    q: str = Query(..., min_length=1, max_length=50),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Typeahead search: users whose username, then name, starts with `q`,
+    followed by fuzzy matches
+    """
+    offset = 0
+    if cursor:
+        (offset,) = decode_cursor(cursor, int)
+        if not 0 < offset < USER_SEARCH_MAX_RESULTS:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    users, has_more = await search_users(db, q, offset, limit)
+    return {"items": users, "next_cursor": encode_cursor(offset + len(users)) if has_more else None}
 
 @router.get("/{user_id}", response_model=schemas.UserPublic)
 async def get_user_profile(
     user_id: UUID,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get a user's public profile information"""
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.get(models.User, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+async def _raise_missing_or(db: AsyncSession, user_id: UUID, detail: str):
+    """A follow write matched no row: 404 if the user does not exist, else 400 with `detail`"""
+    if await db.scalar(select(models.User.id).where(models.User.id == user_id)) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    raise HTTPException(status_code=400, detail=detail)
+
+async def _add_to_follow_counts(db: AsyncSession, follower_id: UUID, followed_id: UUID, delta: int) -> models.User:
+    """
+    Atomically adjust the follower's following_count and the followed user's
+    followers_count, returning the followed user. Rows are updated in id
+    order, so two users following each other at once cannot deadlock.
+    """
+    # updated_at is left as it is: a new follower is not an edit of the profile
+    counts = {
+        follower_id: {"following_count": models.User.following_count + delta, "updated_at": models.User.updated_at},
+        followed_id: {"followers_count": models.User.followers_count + delta, "updated_at": models.User.updated_at},
+    }
+    updated = {}
+    for user_id in sorted(counts):
+        result = await db.execute(
+            select(models.User)
+            .from_statement(
+                update(models.User).where(models.User.id == user_id).values(**counts[user_id]).returning(models.User)
+            )
+            .execution_options(populate_existing=True)
+        )
+        updated[user_id] = result.scalars().one()
+    return updated[followed_id]
+
+@router.post("/me/following/batch", response_model=schemas.FollowBatchResult)
+async def follow_users(
+    batch: schemas.FollowBatch,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Follow several users at once, e.g. during onboarding; reports the outcome per id"""
+    current_user = get_current_principal(request)
+    user_ids = list(dict.fromkeys(batch.user_ids))
+    
+    result = await db.execute(
+        select(models.User.id, models.User.email).where(models.User.id.in_(user_ids))
+    )
+    emails = dict(result.all())
+    candidates = [user_id for user_id in user_ids if user_id in emails and user_id != current_user.id]
+    
+    followed = set()
+    if candidates:
+        # One multi-row insert; edges that already exist are skipped
+        result = await db.execute(
+            pg_insert(models.user_followers)
+            .values([{"follower_id": current_user.id, "followed_id": user_id} for user_id in candidates])
+            .on_conflict_do_nothing()
+            .returning(models.user_followers.c.followed_id)
+        )
+        followed = set(result.scalars().all())
+    
+    if followed:
+        # All counts in one statement, rows sorted by id like the single follow
+        counts = values(
+            column("user_id", PG_UUID(as_uuid=True)),
+            column("followers", Integer),
+            column("following", Integer),
+            name="counts"
+        ).data(sorted([(current_user.id, 0, len(followed)), *((user_id, 1, 0) for user_id in followed)]))
+        await db.execute(
+            update(models.User)
+            .where(models.User.id == counts.c.user_id)
+            .values(
+                followers_count=models.User.followers_count + counts.c.followers,
+                following_count=models.User.following_count + counts.c.following,
+                updated_at=models.User.updated_at
+            )
+        )
+        await backfill_author_stories(db, current_user.id, followed)
+    
+    await db.commit()
+    for user_id in followed:
+        record_follow(current_user.id, user_id)
+    if followed:
+        await invalidate_principal(current_user.email, *(emails[user_id] for user_id in followed))
+    
+    def outcome(user_id: UUID) -> str:
+        if user_id == current_user.id:
+            return "self"
+        if user_id not in emails:
+            return "not_found"
+        return "followed" if user_id in followed else "already_following"
+    
+    return {"results": [{"user_id": user_id, "status": outcome(user_id)} for user_id in user_ids]}
+
 @router.post("/{user_id}/follow", response_model=schemas.UserPublic)
 async def follow_user(
     user_id: UUID,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Follow a user"""
-    current_user = get_current_user_from_request(request)
-    
-    # Check if user exists
-    user_to_follow = db.query(models.User).filter(models.User.id == user_id).first()
-    if user_to_follow is None:
-        raise HTTPException(status_code=404, detail="User not found")
+    current_user = get_current_principal(request)
     
     # Check if trying to follow self
     if current_user.id == user_id:
         raise HTTPException(status_code=400, detail="Cannot follow yourself")
     
-    # Check if already following
-    if user_to_follow in current_user.following:
-        raise HTTPException(status_code=400, detail="Already following this user")
+    # The primary key makes a repeated follow a no-op; selecting from users
+    # means a missing user inserts nothing either
+    followed = await db.execute(
+        pg_insert(models.user_followers)
+        .from_select(
+            ["follower_id", "followed_id"],
+            select(literal(current_user.id, models.User.id.type), models.User.id).where(models.User.id == user_id)
+        )
+        .on_conflict_do_nothing()
+        .returning(models.user_followers.c.followed_id)
+    )
+    if followed.first() is None:
+        await _raise_missing_or(db, user_id, "Already following this user")
     
-    # Add to following
-    current_user.following.append(user_to_follow)
+    user_to_follow = await _add_to_follow_counts(db, current_user.id, user_id, 1)
+    await backfill_author_stories(db, current_user.id, [user_id])
     
-    db.commit()
+    await db.commit()
+    record_follow(current_user.id, user_id)
+    await invalidate_principal(current_user.email, user_to_follow.email)
     return user_to_follow
 
 @router.delete("/{user_id}/unfollow", response_model=schemas.UserPublic)
 async def unfollow_user(
     user_id: UUID,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Unfollow a user"""
-    current_user = get_current_user_from_request(request)
-    
-    # Check if user exists
-    user_to_unfollow = db.query(models.User).filter(models.User.id == user_id).first()
-    if user_to_unfollow is None:
-        raise HTTPException(status_code=404, detail="User not found")
+    current_user = get_current_principal(request)
     
-    # Check if actually following
-    if user_to_unfollow not in current_user.following:
-        raise HTTPException(status_code=400, detail="Not following this user")
+    unfollowed = await db.execute(
+        delete(models.user_followers)
+        .where(
+            models.user_followers.c.follower_id == current_user.id,
+            models.user_followers.c.followed_id == user_id
+        )
+        .returning(models.user_followers.c.followed_id)
+    )
+    if unfollowed.first() is None:
+        await _raise_missing_or(db, user_id, "Not following this user")
     
-    # Remove from following
-    current_user.following.remove(user_to_unfollow)
+    user_to_unfollow = await _add_to_follow_counts(db, current_user.id, user_id, -1)
+    await prune_author_stories(db, current_user.id, user_id)
     
-    db.commit()
+    await db.commit()
+    record_unfollow(current_user.id, user_id)
+    await invalidate_principal(current_user.email, user_to_unfollow.email)
     return user_to_unfollow
 
-@router.get("/me/followers", response_model=List[schemas.UserPublic])
-async def get_my_followers(request: Request):
+def follow_page_query(user_id: UUID, followers: bool, after: Optional[tuple], limit: int):
+    """
+    `limit` of a user's followers (or followed users) after the cursor,
+    keyed on the other user's id so it is a range scan of the
+    (followed_id, follower_id) index or of the primary key respectively
+    """
+    edges = models.user_followers
+    own_side, other_side = (
+        (edges.c.followed_id, edges.c.follower_id) if followers else (edges.c.follower_id, edges.c.followed_id)
+    )
+    query = (
+        select(*PUBLIC_USER_COLUMNS)
+        .join(edges, other_side == models.User.id)
+        .where(own_side == user_id)
+    )
+    if after is not None:
+        query = query.where(keyset_after((other_side,), after))
+    return query.order_by(other_side.desc()).limit(limit)
+
+async def _follow_page(
+    db: AsyncSession, user_id: UUID, followers: bool, cursor: Optional[str], limit: int
+) -> dict:
+    """One keyset page of a user's followers (or followed users)"""
+    after = decode_cursor(cursor, UUID) if cursor else None
+    result = await db.execute(follow_page_query(user_id, followers, after, limit + 1))
+    return paginate(result.all(), limit, lambda user: (user.id,))
+
+def user_exists_query(user_id: UUID):
+    return select(models.User.id).where(models.User.id == user_id)
+
+async def _ensure_user_exists(db: AsyncSession, user_id: UUID) -> None:
+    if await db.scalar(user_exists_query(user_id)) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+@router.get("/me/followers", response_model=schemas.Page[schemas.UserPublic])
+async def get_my_followers(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
     """Get list of users who follow the current user"""
-    current_user = get_current_user_from_request(request)
-    return current_user.followers
+    current_user = get_current_principal(request)
+    return await _follow_page(db, current_user.id, True, cursor, limit)
 
-@router.get("/me/following", response_model=List[schemas.UserPublic])
-async def get_my_following(request: Request):
+@router.get("/me/following", response_model=schemas.Page[schemas.UserPublic])
+async def get_my_following(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
     """Get list of users that the current user follows"""
-    current_user = get_current_user_from_request(request)
-    return current_user.following 
\ No newline at end of file
+    current_user = get_current_principal(request)
+    return await _follow_page(db, current_user.id, False, cursor, limit)
+
+@router.get("/me/suggestions", response_model=List[schemas.FollowSuggestion])
+async def get_follow_suggestions(
+    request: Request,
+    limit: int = Query(20, ge=1, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    """Accounts followed by the people the current user follows, most mutual follows first"""
+    current_user = get_current_principal(request)
+    suggestions = suggest_follows(current_user.id, limit)
+    if suggestions is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Suggestions are not available yet, please retry shortly",
+            headers={"Retry-After": "5"},
+        )
+    if not suggestions:
+        return []
+    
+    result = await db.execute(
+        select(*PUBLIC_USER_COLUMNS).where(models.User.id.in_([user_id for user_id, _ in suggestions]))
+    )
+    users = {user.id: user for user in result.all()}
+    return [
+        {"user": users[user_id], "mutual_count": mutual_count}
+        for user_id, mutual_count in suggestions if user_id in users
+    ]
+
+@router.get("/{user_id}/followers", response_model=schemas.Page[schemas.UserPublic])
+async def get_user_followers(
+    user_id: UUID,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get list of users who follow a user"""
+    await _ensure_user_exists(db, user_id)
+    return await _follow_page(db, user_id, True, cursor, limit)
+
+@router.get("/{user_id}/following", response_model=schemas.Page[schemas.UserPublic])
+async def get_user_following(
+    user_id: UUID,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get list of users that a user follows"""
+    await _ensure_user_exists(db, user_id)
+    return await _follow_page(db, user_id, False, cursor, limit)
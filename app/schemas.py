@@ -1,9 +1,11 @@
-from typing import Optional, List
+from typing import Generic, Literal, Optional, List, TypeVar
 from datetime import datetime
-from pydantic import BaseModel, EmailStr, UUID4, HttpUrl
+from pydantic import BaseModel, EmailStr, Field, UUID4, HttpUrl
 from uuid import UUID
 from fastapi import UploadFile
 
+T = TypeVar("T")
+
 class UserBase(BaseModel):
     email: EmailStr
     username: str
@@ -27,6 +29,8 @@ class User(UserBase):
     bio: Optional[str] = None
     birthday: Optional[datetime] = None
     profile_picture: Optional[str] = None
+    followers_count: int
+    following_count: int
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -39,15 +43,31 @@ class UserPublic(BaseModel):
     fullname: Optional[str] = None
     bio: Optional[str] = None
     profile_picture: Optional[str] = None
+    followers_count: int
+    following_count: int
     created_at: datetime
 
     class Config:
         from_attributes = True
 
+class FollowBatch(BaseModel):
+    user_ids: List[UUID] = Field(..., min_length=1, max_length=100)
+
+class FollowBatchItem(BaseModel):
+    user_id: UUID
+    status: Literal["followed", "already_following", "not_found", "self"]
+
+class FollowBatchResult(BaseModel):
+    results: List[FollowBatchItem]
+
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
 class TokenData(BaseModel):
     email: Optional[str] = None
 
@@ -71,8 +91,39 @@ class Story(BaseModel):
     class Config:
         from_attributes = True
 
-class StoryWithSeenBy(Story):
-    seen_by: List[UserPublic]
+class FeedStory(Story):
+    """A story with the current user's own state"""
+    liked_by_me: bool = False
+    seen_by_me: bool = False
 
-    class Config:
-        from_attributes = True
\ No newline at end of file
+class StorySeenBatch(BaseModel):
+    story_ids: List[UUID] = Field(..., min_length=1, max_length=100)
+
+class StorySeenBatchResult(BaseModel):
+    """The stories that were marked seen; ids of missing stories are left out"""
+    story_ids: List[UUID]
+
+class StoryDetail(Story):
+    seen_count: int
+    recent_viewers: List[UserPublic]
+
+class FollowSuggestion(BaseModel):
+    """An account followed by people the user follows"""
+    user: UserPublic
+    mutual_count: int
+
+class StoryViewer(BaseModel):
+    user: UserPublic
+    seen_at: datetime
+
+class StoryTrayEntry(BaseModel):
+    """One followed author in the story tray"""
+    user: UserPublic
+    latest_story_at: datetime
+    story_count: int
+    has_unseen: bool
+
+class Page(BaseModel, Generic[T]):
+    """One page of a cursor-paginated list; pass next_cursor back to get the next page"""
+    items: List[T]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+
+from .metrics import Histogram
+
+class BoundedPool:
+    """
+    Thread pool for blocking calls made from request handlers. At most
+    `workers` calls run at once and `queue_size` more wait; beyond that new
+    calls are shed with 503 rather than queueing without bound. Counters are
+    only touched from the event loop thread.
+    """
+
+    def __init__(self, thread_name_prefix: str, workers: int, queue_size: int):
+        self.thread_name_prefix = thread_name_prefix
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.queue_wait = Histogram()
+        self.latency = Histogram()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.thread_name_prefix)
+        return self._executor
+
+    @staticmethod
+    def _timed_call(fn, args, submitted_at):
+        started_at = time.perf_counter()
+        result = fn(*args)
+        return result, started_at - submitted_at, time.perf_counter() - started_at
+
+    def _job_done(self, future) -> None:
+        self.in_flight -= 1
+        if not future.cancelled() and future.exception() is None:
+            _, waited, took = future.result()
+            self.queue_wait.observe(waited)
+            self.latency.observe(took)
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool and return its result, or raise 503 if too much work is already queued"""
+        if self.in_flight >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), self._timed_call, fn, args, time.perf_counter()
+        )
+        # Accounted on completion rather than in a finally block, so a cancelled
+        # request (client went away) keeps counting until its call really finishes
+        future.add_done_callback(self._job_done)
+        result, _, _ = await asyncio.shield(future)
+        return result
+
+    def shutdown(self) -> None:
+        """Wait for running calls and drop queued ones; the pool restarts if used again"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_size,
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.workers, 0),
+            "rejected": self.rejected,
+            "queue_wait": self.queue_wait.snapshot(),
+            "latency": self.latency.snapshot(),
+        }
@@ -1,8 +1,7 @@
 import os
 import cloudinary
 import cloudinary.uploader
-from fastapi import UploadFile
-from typing import Optional
+from typing import BinaryIO
 
 def init_cloudinary():
     """Initialize Cloudinary with credentials from environment variables"""
@@ -13,26 +12,16 @@ def init_cloudinary():
         secure=True
     )
 
-async def upload_media(file: UploadFile, folder: str = "stories") -> Optional[str]:
+def upload_to_cloudinary(file: BinaryIO, folder: str, filename: str, chunk_size: int) -> str:
     """
-    Upload media file to Cloudinary
-    Returns the URL of the uploaded file or None if upload fails
+    Upload a file to Cloudinary `chunk_size` bytes at a time and return its URL.
+    Blocking, and closes the file when done.
     """
-    try:
-        # Read file content
-        contents = await file.read()
-        
-        # Upload to cloudinary
-        result = cloudinary.uploader.upload(
-            contents,
-            folder=folder,
-            resource_type="auto",  # Automatically detect if it's image or video
-        )
-        
-        # Return the secure URL
-        return result["secure_url"]
-    except Exception as e:
-        print(f"Error uploading to Cloudinary: {str(e)}")
-        return None
-    finally:
-        await file.seek(0)  # Reset file pointer 
\ No newline at end of file
+    result = cloudinary.uploader.upload_large(
+        file,
+        folder=folder,
+        filename=filename,
+        chunk_size=chunk_size,
+        resource_type="auto",  # Automatically detect if it's image or video
+    )
+    return result["secure_url"]
@@ -0,0 +1,111 @@
+import os
+from typing import Collection, Optional
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, literal, select, union
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from .pagination import keyset_after
+from .story_expiry import live_stories, story_cutoff
+
+load_dotenv()
+
+# Stories of authors with at least this many followers are not fanned out on
+# write; they are merged into each reader's feed at read time instead
+FEED_FANOUT_THRESHOLD = int(os.getenv("FEED_FANOUT_THRESHOLD", "10000"))
+
+feed_items = models.feed_items
+followers = models.user_followers
+
+def should_fan_out(author_id: UUID):
+    """
+    SQL expression for Story.fanned_out of a new story, so the decision is
+    made in the story's INSERT and stays with the story if the author's
+    follower count later crosses the threshold
+    """
+    return (
+        select(models.User.followers_count < FEED_FANOUT_THRESHOLD)
+        .where(models.User.id == author_id)
+        .scalar_subquery()
+    )
+
+async def fan_out_story(db: AsyncSession, story: models.Story) -> None:
+    """
+    Write a new story into its author's feed and, if story.fanned_out, into
+    every follower's feed. Runs in the caller's transaction.
+    """
+    readers = select(literal(story.user_id, models.User.id.type).label("user_id"))
+    if story.fanned_out:
+        readers = union(
+            readers,
+            select(followers.c.follower_id).where(followers.c.followed_id == story.user_id)
+        )
+    readers = readers.subquery()
+    await db.execute(
+        insert(feed_items).from_select(
+            ["user_id", "story_id", "author_id", "created_at"],
+            select(
+                readers.c.user_id,
+                literal(story.id, models.Story.id.type),
+                literal(story.user_id, models.User.id.type),
+                literal(story.created_at, models.Story.created_at.type)
+            )
+        )
+    )
+
+async def backfill_author_stories(db: AsyncSession, follower_id: UUID, author_ids: Collection[UUID]) -> None:
+    """
+    Copy the live, fanned out stories of newly followed authors into the
+    follower's feed; the rest are merged at read time anyway
+    """
+    await db.execute(
+        pg_insert(feed_items).from_select(
+            ["user_id", "story_id", "author_id", "created_at"],
+            select(
+                literal(follower_id, models.User.id.type),
+                models.Story.id,
+                models.Story.user_id,
+                models.Story.created_at
+            ).where(models.Story.user_id.in_(author_ids), models.Story.fanned_out == True, live_stories())
+        ).on_conflict_do_nothing()
+    )
+
+async def prune_author_stories(db: AsyncSession, follower_id: UUID, author_id: UUID) -> None:
+    """Drop an author's stories from the feed of a user who unfollowed them"""
+    await db.execute(
+        delete(feed_items).where(feed_items.c.user_id == follower_id, feed_items.c.author_id == author_id)
+    )
+
+def feed_page_ids(user_id: UUID, after: Optional[tuple], limit: int):
+    """
+    Subquery of the story ids on one page of a user's home feed, newest first.
+    
+    Unions two index range scans, each already cut to the page: the user's
+    materialized feed items, and the live stories of followed authors that
+    were not fanned out when posted. UNION drops the duplicate when the
+    user's own story is in both.
+    """
+    inbox = (
+        select(feed_items.c.story_id, feed_items.c.created_at)
+        .join(models.Story, models.Story.id == feed_items.c.story_id)
+        .where(
+            feed_items.c.user_id == user_id,
+            # Bounds the range scan to the last STORY_TTL_HOURS
+            feed_items.c.created_at > story_cutoff(),
+            models.Story.is_active == True
+        )
+    )
+    followed_authors = select(followers.c.followed_id).where(followers.c.follower_id == user_id)
+    merged = select(models.Story.id.label("story_id"), models.Story.created_at).where(
+        models.Story.user_id.in_(followed_authors),
+        models.Story.fanned_out == False,
+        live_stories()
+    )
+    if after is not None:
+        inbox = inbox.where(keyset_after((feed_items.c.created_at, feed_items.c.story_id), after))
+        merged = merged.where(keyset_after((models.Story.created_at, models.Story.id), after))
+    inbox = inbox.order_by(feed_items.c.created_at.desc(), feed_items.c.story_id.desc()).limit(limit)
+    merged = merged.order_by(models.Story.created_at.desc(), models.Story.id.desc()).limit(limit)
+    return union(inbox, merged).subquery()
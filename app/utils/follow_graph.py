@@ -0,0 +1,270 @@
+import asyncio
+import heapq
+import logging
+import os
+import random
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from .. import models
+from ..database import SessionLocal
+from .metrics import Histogram, register_collector
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# The graph is reloaded from user_followers this often (0 loads it once). Each
+# worker only sees its own follows in between.
+FOLLOW_GRAPH_REBUILD_INTERVAL_SECONDS = float(os.getenv("FOLLOW_GRAPH_REBUILD_INTERVAL_SECONDS", "3600"))
+# Bounds on a suggestion query: followed users looked at, and how many of
+# each one's follows are counted
+FOLLOW_SUGGESTIONS_MAX_FIRST_HOP = int(os.getenv("FOLLOW_SUGGESTIONS_MAX_FIRST_HOP", "200"))
+FOLLOW_SUGGESTIONS_MAX_SECOND_HOP = int(os.getenv("FOLLOW_SUGGESTIONS_MAX_SECOND_HOP", "100"))
+# Edges read from the database per batch while building
+LOAD_BATCH_SIZE = 10000
+BUILD_RETRY_SECONDS = 30
+
+class FollowGraph:
+    """
+    Follow edges as compact integer adjacency arrays (CSR-style): user n
+    follows targets[starts[n]:starts[n] + degrees[n]], kept sorted. Follows
+    and unfollows after the build go to small per-user overlay sets, which
+    are folded in by the next rebuild.
+    Meant to be used from the event loop only; it does no locking.
+    """
+
+    def __init__(self):
+        self.ids: List[UUID] = []
+        self.nodes: Dict[UUID, int] = {}
+        self.starts = array("q")
+        self.degrees = array("i")
+        self.follower_counts = array("i")
+        self.targets = array("i")
+        self._added: Dict[int, Set[int]] = {}
+        self._removed: Dict[int, Set[int]] = {}
+        self._row_node: Optional[int] = None
+        self._row: List[int] = []
+
+    def _node(self, user_id: UUID) -> int:
+        node = self.nodes.get(user_id)
+        if node is None:
+            node = self.nodes[user_id] = len(self.ids)
+            self.ids.append(user_id)
+            self.starts.append(0)
+            self.degrees.append(0)
+            self.follower_counts.append(0)
+        return node
+
+    def _end_row(self) -> None:
+        if self._row_node is not None:
+            self._row.sort()
+            self.starts[self._row_node] = len(self.targets)
+            self.degrees[self._row_node] = len(self._row)
+            self.targets.extend(self._row)
+        self._row_node, self._row = None, []
+
+    def load(self, edges: Iterable[Tuple[UUID, UUID]]) -> None:
+        """
+        Add (follower, followed) edges while building. Each follower's edges
+        must come together, as they do ordered by follower_id; call
+        finish_load() after the last batch.
+        """
+        for follower_id, followed_id in edges:
+            follower = self._node(follower_id)
+            if follower != self._row_node:
+                self._end_row()
+                self._row_node = follower
+            followed = self._node(followed_id)
+            self._row.append(followed)
+            self.follower_counts[followed] += 1
+
+    def finish_load(self) -> None:
+        self._end_row()
+
+    def _in_base(self, follower: int, followed: int) -> bool:
+        start = self.starts[follower]
+        end = start + self.degrees[follower]
+        i = bisect_left(self.targets, followed, start, end)
+        return i < end and self.targets[i] == followed
+
+    def _following(self, node: int):
+        """Who `node` follows: a slice of the arrays, or a set where the overlay changes it"""
+        start = self.starts[node]
+        row = self.targets[start:start + self.degrees[node]]
+        added, removed = self._added.get(node), self._removed.get(node)
+        if added or removed:
+            return (set(row) - (removed or set())) | (added or set())
+        return row
+
+    def follows(self, follower_id: UUID, followed_id: UUID) -> bool:
+        follower, followed = self.nodes.get(follower_id), self.nodes.get(followed_id)
+        if follower is None or followed is None:
+            return False
+        if followed in self._added.get(follower, ()):
+            return True
+        return followed not in self._removed.get(follower, ()) and self._in_base(follower, followed)
+
+    def follow(self, follower_id: UUID, followed_id: UUID) -> None:
+        if self.follows(follower_id, followed_id):
+            return
+        follower, followed = self._node(follower_id), self._node(followed_id)
+        if self._in_base(follower, followed):
+            self._discard(self._removed, follower, followed)
+        else:
+            self._added.setdefault(follower, set()).add(followed)
+        self.follower_counts[followed] += 1
+
+    def unfollow(self, follower_id: UUID, followed_id: UUID) -> None:
+        if not self.follows(follower_id, followed_id):
+            return
+        follower, followed = self.nodes[follower_id], self.nodes[followed_id]
+        if self._in_base(follower, followed):
+            self._removed.setdefault(follower, set()).add(followed)
+        else:
+            self._discard(self._added, follower, followed)
+        self.follower_counts[followed] -= 1
+
+    @staticmethod
+    def _discard(overlay: Dict[int, Set[int]], follower: int, followed: int) -> None:
+        nodes = overlay.get(follower)
+        if nodes is not None:
+            nodes.discard(followed)
+            if not nodes:
+                del overlay[follower]
+
+    def suggest(
+        self, user_id: UUID, limit: int,
+        max_first_hop: int = FOLLOW_SUGGESTIONS_MAX_FIRST_HOP,
+        max_second_hop: int = FOLLOW_SUGGESTIONS_MAX_SECOND_HOP,
+    ) -> List[Tuple[UUID, int]]:
+        """
+        Users followed by the people `user_id` follows, as (user_id, mutual
+        count) with the most mutuals first and ties going to the more followed.
+        Work is bounded by sampling at most max_first_hop followed users and
+        max_second_hop of each one's follows; the sample is seeded by the user,
+        so repeated calls agree.
+        """
+        node = self.nodes.get(user_id)
+        if node is None:
+            return []
+        following = self._following(node)
+        rng = random.Random(user_id.int)
+        first_hop = list(following)
+        if len(first_hop) > max_first_hop:
+            first_hop = rng.sample(first_hop, max_first_hop)
+        mutuals = Counter()
+        for friend in first_hop:
+            second_hop = self._following(friend)
+            if len(second_hop) > max_second_hop:
+                second_hop = rng.sample(list(second_hop), max_second_hop)
+            mutuals.update(second_hop)
+        mutuals.pop(node, None)
+        for followed in following:
+            mutuals.pop(followed, None)
+        best = heapq.nlargest(limit, mutuals.items(), key=lambda item: (item[1], self.follower_counts[item[0]]))
+        return [(self.ids[candidate], count) for candidate, count in best]
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.ids),
+            "edges": len(self.targets),
+            "overlay_users": len(self._added) + len(self._removed),
+            "array_bytes": sum(
+                a.itemsize * len(a) for a in (self.starts, self.degrees, self.follower_counts, self.targets)
+            ),
+        }
+
+# None until the first build has finished
+graph: Optional[FollowGraph] = None
+# Follows and unfollows made while a rebuild reads the table, replayed onto the
+# new graph so none are lost between its snapshot and the swap
+_rebuild_log: Optional[List[Tuple[bool, UUID, UUID]]] = None
+
+_builds = 0
+build_latency = Histogram()
+suggest_latency = Histogram()
+
+def record_follow(follower_id: UUID, followed_id: UUID) -> None:
+    """Apply a committed follow to the in-memory graph"""
+    if graph is not None:
+        graph.follow(follower_id, followed_id)
+    if _rebuild_log is not None:
+        _rebuild_log.append((True, follower_id, followed_id))
+
+def record_unfollow(follower_id: UUID, followed_id: UUID) -> None:
+    """Apply a committed unfollow to the in-memory graph"""
+    if graph is not None:
+        graph.unfollow(follower_id, followed_id)
+    if _rebuild_log is not None:
+        _rebuild_log.append((False, follower_id, followed_id))
+
+def suggest_follows(user_id: UUID, limit: int) -> Optional[List[Tuple[UUID, int]]]:
+    """Friends-of-friends suggestions, or None while the graph is still loading"""
+    if graph is None:
+        return None
+    started_at = time.perf_counter()
+    suggestions = graph.suggest(user_id, limit)
+    suggest_latency.observe(time.perf_counter() - started_at)
+    return suggestions
+
+async def rebuild_follow_graph() -> None:
+    """Load user_followers into a new graph and swap it in"""
+    global graph, _rebuild_log, _builds
+    started_at = time.perf_counter()
+    _rebuild_log = []
+    try:
+        new_graph = FollowGraph()
+        edges = models.user_followers
+        async with SessionLocal() as db:
+            # Primary key order, so each follower's edges arrive together
+            result = await db.stream(
+                select(edges.c.follower_id, edges.c.followed_id)
+                .order_by(edges.c.follower_id, edges.c.followed_id)
+                .execution_options(yield_per=LOAD_BATCH_SIZE)
+            )
+            async for batch in result.partitions():
+                new_graph.load(batch)
+        new_graph.finish_load()
+        for is_follow, follower_id, followed_id in _rebuild_log:
+            if is_follow:
+                new_graph.follow(follower_id, followed_id)
+            else:
+                new_graph.unfollow(follower_id, followed_id)
+        graph = new_graph
+    finally:
+        _rebuild_log = None
+    _builds += 1
+    build_latency.observe(time.perf_counter() - started_at)
+
+async def run_follow_graph() -> None:
+    """Build the graph, then rebuild every FOLLOW_GRAPH_REBUILD_INTERVAL_SECONDS; runs for the app's lifetime"""
+    while True:
+        try:
+            await rebuild_follow_graph()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to build the follow graph, retrying")
+            await asyncio.sleep(BUILD_RETRY_SECONDS)
+            continue
+        if FOLLOW_GRAPH_REBUILD_INTERVAL_SECONDS <= 0:
+            return
+        await asyncio.sleep(FOLLOW_GRAPH_REBUILD_INTERVAL_SECONDS)
+
+def follow_graph_stats() -> dict:
+    return {
+        "ready": graph is not None,
+        **(graph.stats() if graph is not None else {}),
+        "builds": _builds,
+        "build_latency": build_latency.snapshot(),
+        "suggest_latency": suggest_latency.snapshot(),
+    }
+
+register_collector("follow_graph", follow_graph_stats)
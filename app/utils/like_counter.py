@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import Integer, column, delete, insert, select, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .. import models
+from ..database import SessionLocal
+from .metrics import Histogram, register_collector
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Likes are recorded as rows in story_like_deltas and merged into
+# stories.likes_count at this interval, so concurrent likes of one story don't
+# queue on its row lock. 0 updates the row on every like instead.
+LIKE_COUNT_FLUSH_INTERVAL_SECONDS = float(os.getenv("LIKE_COUNT_FLUSH_INTERVAL_SECONDS", "1"))
+# Delta rows merged per transaction
+LIKE_COUNT_MERGE_BATCH_SIZE = int(os.getenv("LIKE_COUNT_MERGE_BATCH_SIZE", "5000"))
+
+# story_id -> likes minus unlikes committed by this worker and not merged yet.
+# Only used to show a liker their own like; the delta rows are what count.
+_pending: Dict[UUID, int] = {}
+# story_like_deltas id -> (story_id, delta) of the rows behind _pending
+_pending_rows: Dict[int, Tuple[UUID, int]] = {}
+_flush_lock = asyncio.Lock()
+
+_failed_flushes = 0
+_merged_rows = 0
+flush_latency = Histogram()
+
+def like_counts_buffered() -> bool:
+    return LIKE_COUNT_FLUSH_INTERVAL_SECONDS > 0
+
+def _add_pending(story_id: UUID, delta: int) -> None:
+    total = _pending.get(story_id, 0) + delta
+    if total:
+        _pending[story_id] = total
+    else:
+        _pending.pop(story_id, None)
+
+def _forget_rows(row_ids: Iterable[int]) -> None:
+    """Take merged rows out of _pending; ids already forgotten or from other workers are skipped"""
+    for row_id in row_ids:
+        row = _pending_rows.pop(row_id, None)
+        if row is not None:
+            story_id, delta = row
+            _add_pending(story_id, -delta)
+
+async def commit_like_delta(db: AsyncSession, story_id: UUID, delta: int) -> None:
+    """
+    Record a like (+1) or unlike (-1) in the same transaction as the
+    user_liked_stories change and commit both; merged by the next flush
+    """
+    row_id = (await db.execute(
+        insert(models.story_like_deltas).values(story_id=story_id, delta=delta).returning(models.story_like_deltas.c.id)
+    )).scalar_one()
+    await db.commit()
+    _pending_rows[row_id] = (story_id, delta)
+    _add_pending(story_id, delta)
+
+def pending_like_delta(story_id: UUID) -> int:
+    """Likes of a story committed here but not in stories.likes_count yet"""
+    return _pending.get(story_id, 0)
+
+def merge_pending_likes(stories: Iterable[models.Story]) -> None:
+    """
+    Add pending deltas to the likes_count of loaded stories, as a loaded value
+    rather than a change, so the session never writes it back
+    """
+    if not _pending:
+        return
+    for story in stories:
+        delta = pending_like_delta(story.id)
+        if delta:
+            set_committed_value(story, "likes_count", story.likes_count + delta)
+
+async def _merge_batch(db: AsyncSession) -> List[int]:
+    """
+    Delete up to a batch of delta rows and add their sums to likes_count, in
+    the caller's transaction; returns the ids of the rows merged. SKIP LOCKED
+    lets workers flushing at the same time take disjoint batches.
+    """
+    deltas = models.story_like_deltas
+    batch = (
+        select(deltas.c.id)
+        .order_by(deltas.c.id)
+        .limit(LIKE_COUNT_MERGE_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    merged = (await db.execute(
+        delete(deltas).where(deltas.c.id.in_(batch.scalar_subquery()))
+        .returning(deltas.c.id, deltas.c.story_id, deltas.c.delta)
+    )).all()
+    totals = Counter()
+    for _, story_id, delta in merged:
+        totals[story_id] += delta
+    # Sorted so concurrent flushes from other workers lock rows in the same order
+    rows = sorted((story_id, delta) for story_id, delta in totals.items() if delta)
+    if rows:
+        sums = values(
+            column("story_id", PG_UUID(as_uuid=True)), column("delta", Integer), name="deltas"
+        ).data(rows)
+        await db.execute(
+            update(models.Story)
+            .where(models.Story.id == sums.c.story_id)
+            # updated_at is for edits to the story, not its like counter
+            .values(likes_count=models.Story.likes_count + sums.c.delta, updated_at=models.Story.updated_at)
+        )
+    return [row_id for row_id, _, _ in merged]
+
+async def flush_like_counts() -> int:
+    """
+    Merge delta rows into stories.likes_count, one transaction per batch;
+    returns the rows merged. A failed or interrupted batch rolls back and its
+    rows stay for the next flush, so nothing is lost or counted twice.
+    """
+    global _failed_flushes, _merged_rows
+    async with _flush_lock:
+        # Likes committed here so far are in rows merged by this flush, or by
+        # one another worker is running
+        shown = list(_pending_rows)
+        started_at = time.perf_counter()
+        merged = 0
+        try:
+            async with SessionLocal() as db:
+                while True:
+                    row_ids = await _merge_batch(db)
+                    await db.commit()
+                    merged += len(row_ids)
+                    # Including rows committed here after the snapshot, which
+                    # would otherwise be counted twice until the next flush
+                    _forget_rows(row_ids)
+                    if len(row_ids) < LIKE_COUNT_MERGE_BATCH_SIZE:
+                        break
+        except Exception:
+            _failed_flushes += 1
+            raise
+        finally:
+            _merged_rows += merged
+        _forget_rows(shown)
+        flush_latency.observe(time.perf_counter() - started_at)
+        return merged
+
+async def run_like_count_flusher() -> None:
+    """Flush every LIKE_COUNT_FLUSH_INTERVAL_SECONDS; runs for the app's lifetime"""
+    while True:
+        await asyncio.sleep(LIKE_COUNT_FLUSH_INTERVAL_SECONDS)
+        try:
+            # Shielded so cancelling the flusher on shutdown lets a merge in
+            # progress finish; drain_like_counts waits for it on the lock
+            await asyncio.shield(flush_like_counts())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to flush like counts, retrying")
+
+async def drain_like_counts() -> None:
+    """Final flush on shutdown, once the flusher task has stopped"""
+    try:
+        await flush_like_counts()
+    except Exception:
+        # The rows are still there; the next worker to flush merges them
+        logger.exception("Failed to merge like counts on shutdown")
+
+def like_counter_stats() -> dict:
+    return {
+        "buffered": like_counts_buffered(),
+        "pending_stories": len(_pending),
+        "merged_rows": _merged_rows,
+        "failed_flushes": _failed_flushes,
+        "flush_latency": flush_latency.snapshot(),
+    }
+
+register_collector("like_counter", like_counter_stats)
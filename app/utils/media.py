@@ -0,0 +1,106 @@
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional
+from dotenv import load_dotenv
+from fastapi import HTTPException, UploadFile, status
+
+from .bounded_pool import BoundedPool
+from .cloudinary import upload_to_cloudinary
+from .metrics import register_collector
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MiB = 1024 * 1024
+
+# "cloudinary", or "local" to write files under MEDIA_LOCAL_DIR instead: a
+# stand-in for development and benchmarks, nothing serves the files
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+MEDIA_LOCAL_DIR = os.getenv("MEDIA_LOCAL_DIR", "media")
+# Largest accepted file per media type
+MEDIA_MAX_IMAGE_BYTES = int(os.getenv("MEDIA_MAX_IMAGE_BYTES", str(10 * MiB)))
+MEDIA_MAX_VIDEO_BYTES = int(os.getenv("MEDIA_MAX_VIDEO_BYTES", str(100 * MiB)))
+# Request bodies are cut off with 413 as soon as they pass this; room for the
+# largest media file plus the rest of the form
+MAX_REQUEST_BODY_BYTES = int(os.getenv(
+    "MAX_REQUEST_BODY_BYTES", str(max(MEDIA_MAX_IMAGE_BYTES, MEDIA_MAX_VIDEO_BYTES) + MiB)
+))
+# Storage calls block, so they run on a pool of this many threads...
+MEDIA_UPLOAD_WORKERS = int(os.getenv("MEDIA_UPLOAD_WORKERS", "4"))
+# ...with at most this many waiting before new uploads are shed with 503
+MEDIA_UPLOAD_QUEUE_SIZE = int(os.getenv("MEDIA_UPLOAD_QUEUE_SIZE", "16"))
+# Bytes read from the spooled upload at a time; Cloudinary wants at least 5 MB per chunk
+MEDIA_UPLOAD_CHUNK_BYTES = int(os.getenv("MEDIA_UPLOAD_CHUNK_BYTES", str(6 * MiB)))
+
+SIZE_LIMITS = {"image": MEDIA_MAX_IMAGE_BYTES, "video": MEDIA_MAX_VIDEO_BYTES}
+
+_pool = BoundedPool("media-upload", MEDIA_UPLOAD_WORKERS, MEDIA_UPLOAD_QUEUE_SIZE)
+
+# Only touched from the event loop thread
+_uploaded_bytes = 0
+
+def _save_locally(file: BinaryIO, folder: str, filename: str) -> str:
+    directory = Path(MEDIA_LOCAL_DIR, folder)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{uuid.uuid4().hex}{Path(filename).suffix}"
+    with file, open(path, "wb") as out:
+        shutil.copyfileobj(file, out, MEDIA_UPLOAD_CHUNK_BYTES)
+    return path.resolve().as_uri()
+
+def _store(file: BinaryIO, folder: str, filename: str) -> str:
+    """Runs on the pool; streams the file to the storage backend"""
+    if STORAGE_BACKEND == "local":
+        return _save_locally(file, folder, filename)
+    return upload_to_cloudinary(file, folder, filename, MEDIA_UPLOAD_CHUNK_BYTES)
+
+def _media_size(file: UploadFile) -> int:
+    if file.size is not None:
+        return file.size
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+async def upload_media(file: UploadFile, folder: str = "stories") -> Optional[str]:
+    """
+    Store an uploaded image or video and return its URL, or None if storage
+    fails. The body has already been spooled by the form parser (to disk past
+    1 MB); it is read from there in chunks on the upload pool, never whole.
+    """
+    global _uploaded_bytes
+    media_type = (file.content_type or "").split("/")[0]
+    limit = SIZE_LIMITS.get(media_type)
+    if limit is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Only image and video files can be uploaded"
+        )
+    size = _media_size(file)
+    if size > limit:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"{media_type.capitalize()} files can be at most {limit // MiB} MB"
+        )
+    
+    try:
+        url = await _pool.run(_store, file.file, folder, file.filename or "upload")
+    except HTTPException:
+        # Shed with 503: the pool is full
+        raise
+    except Exception:
+        logger.exception("Error uploading media to %s", STORAGE_BACKEND)
+        return None
+    _uploaded_bytes += size
+    return url
+
+def shutdown_uploader() -> None:
+    _pool.shutdown()
+
+def media_upload_stats() -> dict:
+    return {"backend": STORAGE_BACKEND, "uploaded_bytes": _uploaded_bytes, **_pool.stats()}
+
+register_collector("media_upload", media_upload_stats)
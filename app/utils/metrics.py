@@ -0,0 +1,46 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Sequence
+
+# Upper bounds, in seconds, for latency histograms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram.
+    Cheap enough to update on every request; not thread-safe, so only
+    observe from the event loop (or accept slightly lossy counts).
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> dict:
+        """Counts per bucket (non-cumulative) keyed by upper bound in ms"""
+        labels = [f"le_{bound * 1000:g}ms" for bound in self.buckets] + ["inf"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+# Name -> callable returning a JSON-serializable snapshot
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+def register_collector(name: str, collector: Callable[[], dict]) -> None:
+    """Expose a metrics snapshot under `name` on the internal metrics endpoint"""
+    _collectors[name] = collector
+
+def collect() -> Dict[str, dict]:
+    return {name: collector() for name, collector in _collectors.items()}
@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Sequence
+from uuid import UUID
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+def _to_json(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+def encode_cursor(*values: Any) -> str:
+    """Opaque cursor holding the sort key of the last row of a page"""
+    raw = json.dumps([_to_json(value) for value in values], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types: Callable[[Any], Any]) -> tuple:
+    """Decode a cursor made by encode_cursor, converting each value with `types`"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(types):
+            raise ValueError("cursor has the wrong number of values")
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def keyset_after(columns: Sequence, cursor: tuple):
+    """
+    Condition selecting rows after the cursor for a descending sort on `columns`.
+    A row-value comparison, so Postgres can seek straight into a matching index.
+    """
+    return tuple_(*columns) < tuple_(*cursor)
+
+def paginate(rows: Sequence, limit: int, sort_key: Callable[[Any], tuple]) -> dict:
+    """
+    Build a page from a query that fetched `limit + 1` rows; the extra row only
+    tells whether there is a next page.
+    """
+    items = list(rows[:limit])
+    next_cursor = encode_cursor(*sort_key(items[-1])) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
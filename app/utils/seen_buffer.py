@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Set, Tuple
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import Integer, column, update, values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..database import SessionLocal
+from .metrics import Histogram, register_collector
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Buffered seen events are written once this many are pending...
+SEEN_BUFFER_MAX_SIZE = int(os.getenv("SEEN_BUFFER_MAX_SIZE", "1000"))
+# ...or at the latest this often
+SEEN_BUFFER_FLUSH_INTERVAL_SECONDS = float(os.getenv("SEEN_BUFFER_FLUSH_INTERVAL_SECONDS", "1"))
+# Events held at most, counting a batch being written. While flushes keep
+# failing, new events past this are dropped rather than growing the buffer.
+SEEN_BUFFER_MAX_PENDING = int(os.getenv("SEEN_BUFFER_MAX_PENDING", "100000"))
+# Rows per INSERT, well under the 32767 bind parameters a statement may have
+SEEN_INSERT_CHUNK_SIZE = 5000
+
+SeenKey = Tuple[UUID, UUID]
+
+# (user_id, story_id) -> seen_at of events not written yet. Rows being flushed
+# stay readable in _flushing until their transaction commits.
+_pending: Dict[SeenKey, datetime] = {}
+_flushing: Dict[SeenKey, datetime] = {}
+# user_id -> story ids in _pending or _flushing, so a user's own lookups don't
+# scan everyone's events
+_by_user: Dict[UUID, Set[UUID]] = {}
+_flush_lock = asyncio.Lock()
+_flush_requested = asyncio.Event()
+
+_flushed_total = 0
+_failed_flushes = 0
+_dropped = 0
+flush_latency = Histogram()
+
+def seen_rows_insert(rows: List[dict]):
+    """Multi-row insert of user_seen_stories rows, returning the story ids of those that were new"""
+    return (
+        pg_insert(models.user_seen_stories)
+        .values(rows)
+        .on_conflict_do_nothing()
+        .returning(models.user_seen_stories.c.story_id)
+    )
+
+def seen_counts_update(new_views: Mapping[UUID, int]):
+    """Add new views to the stories' seen_count with one UPDATE ... FROM (VALUES ...)"""
+    # Sorted so concurrent flushes from other workers lock rows in the same order
+    counts = values(
+        column("story_id", PG_UUID(as_uuid=True)), column("views", Integer), name="counts"
+    ).data(sorted(new_views.items()))
+    return (
+        update(models.Story)
+        .where(models.Story.id == counts.c.story_id)
+        # updated_at is for edits to the story, not its view counter
+        .values(seen_count=models.Story.seen_count + counts.c.views, updated_at=models.Story.updated_at)
+    )
+
+async def record_seen_rows(db: AsyncSession, rows: Iterable[dict]) -> None:
+    """
+    Insert user_seen_stories rows ({user_id, story_id, seen_at}) in multi-row
+    statements; rows that already exist are left as they are. The stories'
+    seen_count goes up by the rows actually inserted.
+    """
+    rows = list(rows)
+    new_views = Counter()
+    for start in range(0, len(rows), SEEN_INSERT_CHUNK_SIZE):
+        result = await db.execute(seen_rows_insert(rows[start:start + SEEN_INSERT_CHUNK_SIZE]))
+        new_views.update(result.scalars().all())
+    if new_views:
+        await db.execute(seen_counts_update(new_views))
+
+def _unindex(keys: Iterable[SeenKey]) -> None:
+    for user_id, story_id in keys:
+        story_ids = _by_user.get(user_id)
+        if story_ids is not None:
+            story_ids.discard(story_id)
+            if not story_ids:
+                del _by_user[user_id]
+
+def record_seen(user_id: UUID, story_id: UUID) -> None:
+    """Queue a seen event; it is written by the next flush, or dropped if the buffer is full"""
+    global _dropped
+    key = (user_id, story_id)
+    if key in _pending or key in _flushing:
+        return
+    if len(_pending) + len(_flushing) >= SEEN_BUFFER_MAX_PENDING:
+        _dropped += 1
+        return
+    _pending[key] = datetime.now(timezone.utc)
+    _by_user.setdefault(user_id, set()).add(story_id)
+    if len(_pending) >= SEEN_BUFFER_MAX_SIZE:
+        _flush_requested.set()
+
+def is_seen_pending(user_id: UUID, story_id: UUID) -> bool:
+    return story_id in _by_user.get(user_id, ())
+
+def pending_seen_story_ids(user_id: UUID) -> Set[UUID]:
+    """Stories the user has seen that are not in the database yet"""
+    return set(_by_user.get(user_id, ()))
+
+async def flush_seen() -> int:
+    """Write all pending seen events in one transaction; returns how many were written"""
+    global _pending, _flushing, _flushed_total, _failed_flushes
+    async with _flush_lock:
+        if not _pending:
+            return 0
+        _flushing, _pending = _pending, {}
+        _flush_requested.clear()
+        started_at = time.perf_counter()
+        try:
+            async with SessionLocal() as db:
+                await record_seen_rows(db, (
+                    {"user_id": user_id, "story_id": story_id, "seen_at": seen_at}
+                    for (user_id, story_id), seen_at in _flushing.items()
+                ))
+                await db.commit()
+        except Exception:
+            _failed_flushes += 1
+            # Keep the events for the next attempt. Events queued meanwhile
+            # counted the batch against the cap, so this stays within it.
+            _pending = {**_flushing, **_pending}
+            raise
+        finally:
+            # Written, or dropped by an interrupted flush; restored events stay indexed
+            _unindex(key for key in _flushing if key not in _pending)
+            flushed, _flushing = len(_flushing), {}
+        flush_latency.observe(time.perf_counter() - started_at)
+        _flushed_total += flushed
+        return flushed
+
+async def run_seen_flusher() -> None:
+    """Flush on the size threshold or every SEEN_BUFFER_FLUSH_INTERVAL_SECONDS; runs for the app's lifetime"""
+    while True:
+        try:
+            await asyncio.wait_for(_flush_requested.wait(), SEEN_BUFFER_FLUSH_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            # Shielded: cancelling the flusher on shutdown must not abandon a
+            # batch mid-write. The flush keeps the lock until it finishes, so
+            # drain_seen_buffer waits for it and then writes whatever is left.
+            await asyncio.shield(flush_seen())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Failed to flush seen events, retrying")
+            await asyncio.sleep(SEEN_BUFFER_FLUSH_INTERVAL_SECONDS)
+
+async def drain_seen_buffer() -> None:
+    """Final flush on shutdown, once the flusher task has stopped"""
+    try:
+        await flush_seen()
+    except Exception:
+        logger.exception("Lost %d buffered seen events on shutdown", len(_pending))
+
+def seen_buffer_stats() -> dict:
+    return {
+        "pending": len(_pending) + len(_flushing),
+        "flushed": _flushed_total,
+        "failed_flushes": _failed_flushes,
+        "dropped": _dropped,
+        "flush_latency": flush_latency.snapshot(),
+    }
+
+register_collector("seen_buffer", seen_buffer_stats)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Collection
+from uuid import UUID
+from dotenv import load_dotenv
+from sqlalchemy import and_, delete, select, update
+
+from .. import models
+from ..database import SessionLocal
+from .metrics import Histogram, register_collector
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Stories disappear from feeds this long after they were posted
+STORY_TTL_HOURS = float(os.getenv("STORY_TTL_HOURS", "24"))
+# How often each worker sweeps expired stories; 0 disables the sweeper
+STORY_EXPIRY_INTERVAL_SECONDS = float(os.getenv("STORY_EXPIRY_INTERVAL_SECONDS", "60"))
+# Stories deactivated per transaction, which bounds how long row locks are held
+STORY_EXPIRY_BATCH_SIZE = int(os.getenv("STORY_EXPIRY_BATCH_SIZE", "500"))
+
+_expired_total = 0
+sweep_latency = Histogram()
+
+def story_cutoff() -> datetime:
+    """Stories created at or before this are expired"""
+    return datetime.now(timezone.utc) - timedelta(hours=STORY_TTL_HOURS)
+
+def live_stories():
+    """
+    Filter for stories that are still visible. Also checks the age, so expired
+    stories stay hidden between sweeps.
+    """
+    return and_(models.Story.is_active == True, models.Story.created_at > story_cutoff())
+
+def expire_batch_update():
+    """Deactivate the oldest batch of expired stories, returning their ids"""
+    batch = (
+        select(models.Story.id)
+        .where(models.Story.is_active == True, models.Story.created_at <= story_cutoff())
+        .order_by(models.Story.created_at)
+        .limit(STORY_EXPIRY_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return (
+        update(models.Story)
+        .where(models.Story.id.in_(batch))
+        .values(is_active=False)
+        .returning(models.Story.id)
+    )
+
+def feed_items_delete(story_ids: Collection[UUID]):
+    return delete(models.feed_items).where(models.feed_items.c.story_id.in_(story_ids))
+
+async def expire_stories_batch() -> int:
+    """
+    Deactivate one batch of expired stories and drop them from feeds.
+    Rows locked by another transaction (another worker's sweep, a like) are
+    skipped and picked up by a later sweep. Returns the number expired.
+    """
+    async with SessionLocal() as db:
+        result = await db.execute(expire_batch_update())
+        expired_ids = result.scalars().all()
+        if expired_ids:
+            await db.execute(feed_items_delete(expired_ids))
+        await db.commit()
+    return len(expired_ids)
+
+async def sweep_expired_stories() -> int:
+    """Expire batches until a short one shows the backlog is cleared"""
+    global _expired_total
+    started_at = time.perf_counter()
+    expired = 0
+    while True:
+        count = await expire_stories_batch()
+        expired += count
+        _expired_total += count
+        if count < STORY_EXPIRY_BATCH_SIZE:
+            break
+    sweep_latency.observe(time.perf_counter() - started_at)
+    return expired
+
+async def run_story_expiry() -> None:
+    """Sweep expired stories every STORY_EXPIRY_INTERVAL_SECONDS; runs for the app's lifetime"""
+    while True:
+        try:
+            expired = await sweep_expired_stories()
+            if expired:
+                logger.info("Expired %d stories", expired)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Story expiry sweep failed, retrying")
+        await asyncio.sleep(STORY_EXPIRY_INTERVAL_SECONDS)
+
+def expiry_stats() -> dict:
+    return {
+        "ttl_hours": STORY_TTL_HOURS,
+        "expired": _expired_total,
+        "sweep_latency": sweep_latency.snapshot(),
+    }
+
+register_collector("story_expiry", expiry_stats)
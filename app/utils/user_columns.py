@@ -0,0 +1,5 @@
+from .. import models, schemas
+
+# Only what UserPublic shows, so user lists and search results skip password
+# hashes, emails and the rest of the row
+PUBLIC_USER_COLUMNS = tuple(getattr(models.User, field) for field in schemas.UserPublic.model_fields)
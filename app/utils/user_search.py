@@ -0,0 +1,131 @@
+import logging
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, literal, or_, select, text
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from .cache import TTLCache
+from .metrics import Histogram, register_collector
+from .user_columns import PUBLIC_USER_COLUMNS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How deep a search can page; a typeahead never needs more
+USER_SEARCH_MAX_RESULTS = int(os.getenv("USER_SEARCH_MAX_RESULTS", "100"))
+# Queries this short are the hottest and match the most users, so their
+# results are kept in memory for USER_SEARCH_CACHE_TTL_SECONDS
+USER_SEARCH_CACHE_PREFIX_LENGTH = int(os.getenv("USER_SEARCH_CACHE_PREFIX_LENGTH", "3"))
+USER_SEARCH_CACHE_SIZE = int(os.getenv("USER_SEARCH_CACHE_SIZE", "5000"))
+USER_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("USER_SEARCH_CACHE_TTL_SECONDS", "30"))
+# Shorter queries have too few trigrams for fuzzy matching to mean anything
+FUZZY_MIN_LENGTH = 3
+
+search_cache = TTLCache(USER_SEARCH_CACHE_SIZE, USER_SEARCH_CACHE_TTL_SECONDS)
+query_latency = Histogram()
+
+# Whether pg_trgm is installed; checked on the first search
+_trigram_available: Optional[bool] = None
+
+def _starts_with(column, prefix: str):
+    """
+    `column` starts with `prefix`, as a byte range the text_pattern_ops
+    indexes can seek (a LIKE pattern only can when it is a literal in the SQL)
+    """
+    at_or_after = column.op("~>=~", is_comparison=True)(prefix)
+    last = ord(prefix[-1])
+    if last == sys.maxunicode:
+        return and_(at_or_after, column.startswith(prefix, autoescape=True))
+    # Surrogates have no UTF-8 encoding, so the next character is past them
+    following = last + 1 if last + 1 != 0xD800 else 0xE000
+    return and_(at_or_after, column.op("~<~", is_comparison=True)(prefix[:-1] + chr(following)))
+
+async def _prefix_matches(db: AsyncSession, column, prefix: str, limit: int) -> List[Row]:
+    """Users whose `column` starts with `prefix`, in byte order, so an exact match comes first"""
+    result = await db.execute(
+        select(*PUBLIC_USER_COLUMNS)
+        .where(_starts_with(func.lower(column), prefix))
+        # The index's own order; a plain ORDER BY lower(...) would sort every match
+        .order_by(text(f"lower(users.{column.name}) USING ~<~"))
+        .limit(limit)
+    )
+    return result.all()
+
+async def _trigram_enabled(db: AsyncSession) -> bool:
+    global _trigram_available
+    if _trigram_available is None:
+        _trigram_available = bool(await db.scalar(
+            text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        ))
+        if not _trigram_available:
+            logger.warning("pg_trgm is not installed; user search matches prefixes only")
+    return _trigram_available
+
+async def _fuzzy_matches(db: AsyncSession, query: str, limit: int) -> List[Row]:
+    """Users with a word in their username or name similar to `query`, most similar first"""
+    similarity = func.greatest(
+        func.word_similarity(query, models.User.username),
+        func.word_similarity(query, func.coalesce(models.User.fullname, "")),
+    )
+    result = await db.execute(
+        select(*PUBLIC_USER_COLUMNS)
+        # <% uses pg_trgm.word_similarity_threshold and the gin_trgm_ops indexes
+        .where(or_(
+            literal(query).op("<%", is_comparison=True)(models.User.username),
+            literal(query).op("<%", is_comparison=True)(models.User.fullname),
+        ))
+        .order_by(similarity.desc(), models.User.username)
+        .limit(limit)
+    )
+    return result.all()
+
+async def _ranked_matches(db: AsyncSession, query: str, limit: int) -> List[Row]:
+    """
+    Up to `limit` users ranked by username prefix, then name prefix, then
+    fuzzy similarity. Later tiers are only queried while the page is short.
+    """
+    started_at = time.perf_counter()
+    matches = {}
+    for column in (models.User.username, models.User.fullname):
+        for user in await _prefix_matches(db, column, query, limit):
+            matches.setdefault(user.id, user)
+        if len(matches) >= limit:
+            break
+    if len(matches) < limit and len(query) >= FUZZY_MIN_LENGTH and await _trigram_enabled(db):
+        for user in await _fuzzy_matches(db, query, limit):
+            matches.setdefault(user.id, user)
+    query_latency.observe(time.perf_counter() - started_at)
+    return list(matches.values())[:limit]
+
+async def search_users(db: AsyncSession, query: str, offset: int, limit: int) -> Tuple[List[Row], bool]:
+    """
+    Users matching `query` from `offset` on, and whether there are more.
+    Results stop at USER_SEARCH_MAX_RESULTS. Short queries are served from
+    search_cache, so new users and renames show up there within its TTL.
+    """
+    query = query.strip().lower()
+    if not query:
+        return [], False
+    if len(query) <= USER_SEARCH_CACHE_PREFIX_LENGTH:
+        matches = search_cache.get(query)
+        if matches is None:
+            matches = await _ranked_matches(db, query, USER_SEARCH_MAX_RESULTS)
+            search_cache.set(query, matches)
+    else:
+        matches = await _ranked_matches(db, query, min(offset + limit + 1, USER_SEARCH_MAX_RESULTS))
+    return matches[offset:offset + limit], len(matches) > offset + limit
+
+def user_search_stats() -> dict:
+    return {
+        "trigram": _trigram_available,
+        "cache": search_cache.stats(),
+        "query_latency": query_latency.snapshot(),
+    }
+
+register_collector("user_search", user_search_stats)
@@ -0,0 +1,77 @@
+"""
+Concurrent-request throughput benchmark.
+
+Registers (or logs in) a benchmark user against a running server and fires
+authenticated GET requests at a set of endpoints with a fixed concurrency,
+then reports throughput and latency percentiles.
+
+Run it against the server before and after a change to compare, e.g.:
+
+    python benchmarks/concurrent_requests.py --base-url http://localhost:8000 \
+        --concurrency 64 --requests 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def get_token(client: httpx.AsyncClient, prefix: str, email: str, password: str) -> str:
+    await client.post(f"{prefix}/auth/register", json={
+        "email": email,
+        "username": email.split("@")[0],
+        "password": password,
+    })
+    response = await client.post(f"{prefix}/auth/login", data={"username": email, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def run(args):
+    prefix = f"/api/{args.api_version}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        token = await get_token(client, prefix, args.email, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+        paths = [f"{prefix}{path}" for path in args.paths]
+
+        latencies = []
+        errors = 0
+        counter = iter(range(args.requests))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                response = await client.get(paths[i % len(paths)], headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(f"requests:     {len(latencies)} ({errors} errors)")
+    print(f"concurrency:  {args.concurrency}")
+    print(f"elapsed:      {elapsed:.2f}s")
+    print(f"throughput:   {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency mean: {statistics.mean(latencies) * 1000:.1f} ms")
+    for pct in (50, 90, 99):
+        print(f"latency p{pct}:  {percentile(latencies, pct) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--api-version", default="v1")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--paths", nargs="+", default=["/stories/", "/users/me/following", "/stories/me"])
+    asyncio.run(run(parser.parse_args()))
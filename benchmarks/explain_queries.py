@@ -0,0 +1,209 @@
+"""
+Seed a realistic dataset and capture EXPLAIN ANALYZE plans for the router queries.
+
+Run against a scratch database that already has the schema (alembic upgrade head):
+
+    DATABASE_URL=postgresql://localhost/stories_explain \
+        python benchmarks/explain_queries.py --seed --users 20000 --output plans.txt
+
+Follow targets are skewed so a few accounts get most followers. Stories are
+spread over the last week, and views and likes cluster on popular stories. Keep
+the plans file around and diff it after schema or query changes to spot
+regressions (sequential scans, sorts, growing buffer counts).
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+from uuid import UUID
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, text
+
+from app.database import SQLALCHEMY_DATABASE_URL
+from app import models
+from app.routers.stories import (
+    VIEWERS_PREVIEW_SIZE, existing_stories_query, feed_query, has_seen_query, is_following_query, like_delete,
+    like_insert, likes_count_update, my_stories_query, recent_viewers_query, story_page_query, story_query,
+    tray_query, viewer_state_query, viewers_page_query,
+)
+from app.routers.users import follow_page_query, user_exists_query
+from app.utils.seen_buffer import seen_counts_update, seen_rows_insert
+from app.utils.story_expiry import STORY_EXPIRY_BATCH_SIZE, expire_batch_update, feed_items_delete
+
+SEED_SQL = [
+    """
+    INSERT INTO users (id, email, username, hashed_password, token_version, created_at)
+    SELECT gen_random_uuid(), 'seed' || i || '@example.com', 'seed' || i, 'x', 0,
+           now() - random() * interval '365 days'
+    FROM generate_series(1, :users) AS i
+    """,
+    "CREATE TEMP TABLE seed_users AS SELECT id, row_number() OVER (ORDER BY id) AS rn FROM users WHERE email LIKE 'seed%%'",
+    "CREATE UNIQUE INDEX ON seed_users (rn)",
+    # Cubing random() skews follows towards low rn: a power-law-ish popularity curve
+    """
+    INSERT INTO user_followers (follower_id, followed_id)
+    SELECT f.id, t.id
+    FROM (
+        SELECT id, 1 + floor(power(random(), 3) * :users)::int AS target
+        FROM seed_users, generate_series(1, :follows)
+    ) AS f
+    JOIN seed_users AS t ON t.rn = f.target
+    WHERE t.id <> f.id
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO stories (id, user_id, media_url, caption, is_active, likes_count, created_at)
+    SELECT gen_random_uuid(), u.id, 'https://example.com/media.jpg', NULL, true, 0,
+           now() - random() * interval '7 days'
+    FROM seed_users AS u, generate_series(1, :stories)
+    WHERE random() < 0.5
+    """,
+    "UPDATE stories SET is_active = created_at > now() - interval '24 hours'",
+    """
+    INSERT INTO user_seen_stories (user_id, story_id, seen_at)
+    SELECT v.id, s.id, s.created_at + random() * interval '1 day'
+    FROM (SELECT id, created_at, 1 + floor(power(random(), 2) * :views)::int AS viewers FROM stories) AS s
+    CROSS JOIN LATERAL generate_series(1, s.viewers) AS g(n)
+    JOIN seed_users AS v ON v.rn = 1 + abs(hashtext(s.id::text || g.n)) % :users
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO user_liked_stories (user_id, story_id)
+    SELECT user_id, story_id FROM user_seen_stories WHERE random() < 0.1
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    UPDATE stories SET seen_count = s.n
+    FROM (SELECT story_id, count(*) AS n FROM user_seen_stories GROUP BY story_id) AS s
+    WHERE s.story_id = stories.id
+    """,
+    """
+    UPDATE stories SET likes_count = l.n
+    FROM (SELECT story_id, count(*) AS n FROM user_liked_stories GROUP BY story_id) AS l
+    WHERE l.story_id = stories.id
+    """,
+    """
+    UPDATE users SET followers_count = f.n
+    FROM (SELECT followed_id, count(*) AS n FROM user_followers GROUP BY followed_id) AS f
+    WHERE f.followed_id = users.id
+    """,
+    # Materialized feeds, as fan-out on write would have left them
+    """
+    INSERT INTO feed_items (user_id, story_id, author_id, created_at)
+    SELECT user_id, id, user_id, created_at FROM stories WHERE is_active
+    UNION
+    SELECT f.follower_id, s.id, s.user_id, s.created_at
+    FROM user_followers AS f JOIN stories AS s ON s.user_id = f.followed_id
+    WHERE s.is_active
+    """,
+    "ANALYZE",
+]
+
+def seed(conn, args):
+    params = {"users": args.users, "follows": args.follows, "stories": args.stories, "views": args.views}
+    for statement in SEED_SQL:
+        conn.execute(text(statement), params)
+
+def router_queries(conn):
+    """
+    The statements the routers issue, built by the routers' own query
+    functions and bound to a heavy reader, a popular author and story
+    """
+    followers = models.user_followers
+    reader = conn.execute(
+        select(followers.c.follower_id).group_by(followers.c.follower_id)
+        .order_by(text("count(*) DESC")).limit(1)
+    ).scalar_one()
+    author = conn.execute(
+        select(followers.c.followed_id).group_by(followers.c.followed_id)
+        .order_by(text("count(*) DESC")).limit(1)
+    ).scalar_one()
+    story = conn.execute(
+        select(models.Story.id).where(models.Story.is_active == True)
+        .order_by(models.Story.likes_count.desc()).limit(1)
+    ).scalar_one()
+    # An ordinary account, well down the follower ranking
+    account = conn.execute(
+        select(followers.c.followed_id).group_by(followers.c.followed_id)
+        .order_by(text("count(*) DESC"), followers.c.followed_id).offset(100).limit(1)
+    ).scalar_one()
+    # The stories on the reader's first feed page, and the next ones a sweep will expire
+    page_stories = conn.execute(
+        select(models.feed_items.c.story_id).where(models.feed_items.c.user_id == reader)
+        .order_by(models.feed_items.c.created_at.desc()).limit(20)
+    ).scalars().all()
+    oldest_stories = conn.execute(
+        select(models.Story.id).where(models.Story.is_active == True)
+        .order_by(models.Story.created_at).limit(STORY_EXPIRY_BATCH_SIZE)
+    ).scalars().all()
+    now = datetime.now(timezone.utc)
+    cursor = (now, story)
+    # Half way through the id space, so a next page starts mid-list
+    user_cursor = (UUID(int=1 << 127),)
+    seen_rows = [{"user_id": reader, "story_id": story_id, "seen_at": now} for story_id in page_stories]
+    
+    return {
+        "GET /stories/ (feed, first page)": story_page_query(feed_query(reader, None, 21), None, 21),
+        "GET /stories/ (feed, next page)": story_page_query(feed_query(reader, cursor, 21), cursor, 21),
+        "GET /stories/ (viewer state)": viewer_state_query(reader, page_stories),
+        "GET /stories/me": story_page_query(my_stories_query(author), None, 21),
+        "GET /stories/tray": tray_query(reader, (), 100),
+        "GET /stories/{id} (story)": story_query(story),
+        "GET /stories/{id} (recent viewers)": recent_viewers_query(story, VIEWERS_PREVIEW_SIZE),
+        "GET /stories/{id} (seen check)": has_seen_query(reader, story),
+        "GET /stories/{id} (follow check)": is_following_query(reader, author),
+        "GET /stories/{id}/viewers (first page)": viewers_page_query(story, None, 101),
+        "GET /stories/{id}/viewers (next page)": viewers_page_query(story, (now, user_cursor[0]), 101),
+        "POST /stories/seen (existing stories)": existing_stories_query(page_stories),
+        "POST /stories/seen and buffered views (insert)": seen_rows_insert(seen_rows),
+        "POST /stories/seen and buffered views (seen_count)": seen_counts_update({story_id: 1 for story_id in page_stories}),
+        "POST /stories/{id}/like (insert)": like_insert(reader, story),
+        "POST /stories/{id}/like (likes_count, unbuffered)": likes_count_update(story, 1),
+        "DELETE /stories/{id}/unlike (delete)": like_delete(reader, story),
+        "GET /users/me/followers (first page)": follow_page_query(author, True, None, 101),
+        "GET /users/me/followers (next page)": follow_page_query(author, True, user_cursor, 101),
+        "GET /users/me/following (first page)": follow_page_query(reader, False, None, 101),
+        "GET /users/me/following (next page)": follow_page_query(reader, False, user_cursor, 101),
+        "GET /users/{id}/followers|following (user check)": user_exists_query(account),
+        "GET /users/{id}/followers": follow_page_query(account, True, None, 101),
+        "GET /users/{id}/following": follow_page_query(account, False, None, 101),
+        "Story expiry sweep (deactivate batch)": expire_batch_update(),
+        "Story expiry sweep (drop from feeds)": feed_items_delete(oldest_stories),
+    }
+
+def explain(conn, statement) -> str:
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    # ANALYZE runs the statement, so writes are rolled back to keep the dataset as seeded
+    with conn.begin_nested() as savepoint:
+        rows = conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {compiled}", compiled.params)
+        plan = "\n".join(row[0] for row in rows)
+        savepoint.rollback()
+    return plan
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="insert the synthetic dataset first")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--follows", type=int, default=150, help="follow attempts per user")
+    parser.add_argument("--stories", type=int, default=6, help="stories per user over a week (about half are kept)")
+    parser.add_argument("--views", type=int, default=200, help="max viewers of a story")
+    parser.add_argument("--output", help="write the plans to this file as well")
+    args = parser.parse_args()
+    
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.begin() as conn:
+        if args.seed:
+            seed(conn, args)
+        report = []
+        for name, statement in router_queries(conn).items():
+            report.append(f"=== {name}\n{explain(conn, statement)}\n")
+    output = "\n".join(report)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Follow graph memory and suggestion latency at scale.
+
+Builds the in-memory follow graph behind GET /users/me/suggestions from a
+synthetic follow graph, in-process (no server or database needed), and reports
+its memory, build time, and the latency of suggestions and of follow/unfollow
+updates:
+
+    python benchmarks/follow_graph.py --users 1000000 --edges 10000000
+
+Follow targets are skewed so a few accounts get most followers, like
+explain_queries.py seeds them. Memory is the growth in resident set size over
+the build, so it includes the UUID index as well as the adjacency arrays.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from uuid import UUID
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+
+from app.utils.follow_graph import FollowGraph
+from concurrent_requests import percentile
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def edges(user_ids: list, edge_count: int, rng: random.Random):
+    """(follower, followed) pairs grouped by follower; cubing random() skews follows to low indexes"""
+    users = len(user_ids)
+    mean_degree = edge_count / users
+    for follower in range(users):
+        degree = min(users - 1, int(rng.expovariate(1 / mean_degree)))
+        followed = {int(rng.random() ** 3 * users) for _ in range(degree)}
+        followed.discard(follower)
+        follower_id = user_ids[follower]
+        for target in followed:
+            yield follower_id, user_ids[target]
+
+def report(name: str, latencies: list):
+    print(f"{name}:")
+    print(f"  calls:        {len(latencies)}")
+    print(f"  latency mean: {statistics.mean(latencies) * 1000:.3f} ms")
+    for pct in (50, 90, 99):
+        print(f"  latency p{pct}:  {percentile(latencies, pct) * 1000:.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--edges", type=int, default=10000000, help="approximate number of follows")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20, help="suggestions per call")
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.random_seed)
+    rss_before = rss_bytes()
+    user_ids = [UUID(int=i + 1) for i in range(args.users)]
+    started = time.perf_counter()
+    graph = FollowGraph()
+    graph.load(edges(user_ids, args.edges, rng))
+    graph.finish_load()
+    build_seconds = time.perf_counter() - started
+    stats = graph.stats()
+    print(f"users:        {stats['users']}")
+    print(f"edges:        {stats['edges']}")
+    print(f"build:        {build_seconds:.1f}s (including generating the edges)")
+    print(f"arrays:       {stats['array_bytes'] / 2**20:.1f} MiB")
+    print(f"rss growth:   {(rss_bytes() - rss_before) / 2**20:.1f} MiB (arrays and UUID index)")
+
+    readers = [rng.choice(user_ids) for _ in range(args.queries)]
+    latencies = []
+    for user_id in readers:
+        started = time.perf_counter()
+        graph.suggest(user_id, args.limit)
+        latencies.append(time.perf_counter() - started)
+    report("suggest", latencies)
+
+    latencies = []
+    for user_id in readers:
+        target = rng.choice(user_ids)
+        started = time.perf_counter()
+        graph.follow(user_id, target)
+        graph.unfollow(user_id, target)
+        latencies.append(time.perf_counter() - started)
+    report("follow + unfollow", latencies)
+
+if __name__ == "__main__":
+    main()
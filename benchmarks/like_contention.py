@@ -0,0 +1,100 @@
+"""
+Hot-story like benchmark.
+
+Many users like and unlike the same story concurrently, which is the worst
+case for a like counter kept on the story row. Run it against a server with the
+batched like counter (the default) and with LIKE_COUNT_FLUSH_INTERVAL_SECONDS=0
+(one row update per like) to compare:
+
+    python benchmarks/like_contention.py --base-url http://localhost:8000 \
+        --users 64 --requests 5000 --story-id <uuid>
+
+Without --story-id the first user posts a story, which needs working media
+storage on the server. Throughput and latency cover the like/unlike requests
+only. After the run the story's likes_count should be back where it started.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from concurrent_requests import get_token, percentile
+
+# Smallest valid GIF, for posting the story when none is given
+PIXEL_GIF = b"GIF89a\x01\x00\x01\x00\x00\x00\x00;"
+
+async def run(args):
+    prefix = f"/api/{args.api_version}"
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        tokens = await asyncio.gather(*(
+            get_token(client, prefix, f"like-bench-{i}@example.com", args.password) for i in range(args.users)
+        ))
+        headers = [{"Authorization": f"Bearer {token}"} for token in tokens]
+
+        story_id = args.story_id
+        if story_id is None:
+            response = await client.post(
+                f"{prefix}/stories/", headers=headers[0], files={"media_file": ("pixel.gif", PIXEL_GIF, "image/gif")}
+            )
+            response.raise_for_status()
+            story_id = response.json()["id"]
+        like_path = f"{prefix}/stories/{story_id}/like"
+        unlike_path = f"{prefix}/stories/{story_id}/unlike"
+
+        # Start from a clean state: no benchmark user likes the story
+        await asyncio.gather(*(client.delete(unlike_path, headers=h) for h in headers))
+        response = await client.get(f"{prefix}/stories/{story_id}", headers=headers[0])
+        response.raise_for_status()
+        likes_before = response.json()["likes_count"]
+
+        latencies = []
+        errors = 0
+        counter = iter(range(args.requests))
+
+        async def user(user_headers):
+            nonlocal errors
+            liked = False
+            for _ in counter:
+                started = time.perf_counter()
+                if liked:
+                    response = await client.delete(unlike_path, headers=user_headers)
+                else:
+                    response = await client.post(like_path, headers=user_headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors += 1
+                liked = not liked
+            if liked:
+                await client.delete(unlike_path, headers=user_headers)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(h) for h in headers))
+        elapsed = time.perf_counter() - started
+
+        # Give a buffered counter time to merge before checking it
+        await asyncio.sleep(args.settle)
+        response = await client.get(f"{prefix}/stories/{story_id}", headers=headers[0])
+        likes_after = response.json()["likes_count"]
+
+    print(f"requests:     {len(latencies)} ({errors} errors)")
+    print(f"users:        {args.users}")
+    print(f"elapsed:      {elapsed:.2f}s")
+    print(f"throughput:   {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency mean: {statistics.mean(latencies) * 1000:.1f} ms")
+    for pct in (50, 90, 99):
+        print(f"latency p{pct}:  {percentile(latencies, pct) * 1000:.1f} ms")
+    print(f"likes_count:  {likes_before} before, {likes_after} after")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--api-version", default="v1")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--users", type=int, default=64, help="concurrent users, one connection each")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--story-id", help="story to like; by default a new one is posted")
+    parser.add_argument("--settle", type=float, default=2, help="seconds to wait before the final count")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,138 @@
+"""
+Concurrent story upload benchmark.
+
+Posts stories with large media files from many clients at once, while pinging
+GET / to see whether uploads hold up the event loop, then sends one file over
+the size limit to check it is refused early. Start the server with the local
+stand-in storage so no media service is involved:
+
+    STORAGE_BACKEND=local MEDIA_LOCAL_DIR=/tmp/media uvicorn app.main:app --port 8000
+    python benchmarks/media_upload.py --base-url http://localhost:8000 \
+        --concurrency 8 --uploads 32 --size-mb 50 --server-pid <uvicorn pid>
+
+With --server-pid (and the server on the same machine) it also reports the
+server's resident memory, current and peak. Peak RSS should stay far below
+concurrency x file size, as uploads are spooled to disk and streamed to storage
+in chunks.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from concurrent_requests import get_token, percentile
+
+MiB = 1024 * 1024
+
+def write_media_file(size: int) -> str:
+    """A temporary file of `size` random bytes, so the client streams it rather than holding it"""
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    with os.fdopen(fd, "wb") as f:
+        block = os.urandom(MiB)
+        for _ in range(size // MiB):
+            f.write(block)
+        f.write(block[:size % MiB])
+    return path
+
+def server_memory(pid: int) -> dict:
+    """VmRSS and VmHWM (peak RSS) of the server process, in MiB"""
+    memory = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "VmHWM"):
+                memory[name] = int(value.split()[0]) / 1024
+    return memory
+
+async def run(args):
+    prefix = f"/api/{args.api_version}"
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    media_path = write_media_file(int(args.size_mb * MiB))
+    oversized_path = write_media_file(int(args.oversized_mb * MiB))
+    try:
+        async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=600) as client:
+            token = await get_token(client, prefix, args.email, args.password)
+            headers = {"Authorization": f"Bearer {token}"}
+            if args.server_pid:
+                print(f"server memory before: {server_memory(args.server_pid)}")
+
+            latencies = []
+            errors = 0
+            counter = iter(range(args.uploads))
+            uploading = True
+
+            async def uploader():
+                nonlocal errors
+                for _ in counter:
+                    with open(media_path, "rb") as media:
+                        started = time.perf_counter()
+                        response = await client.post(
+                            f"{prefix}/stories/", headers=headers, files={"media_file": ("clip.mp4", media, "video/mp4")}
+                        )
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code >= 400:
+                        errors += 1
+
+            async def pinger():
+                # A separate client so pings don't wait for an upload's connection
+                ping_latencies = []
+                async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as ping_client:
+                    while uploading:
+                        started = time.perf_counter()
+                        await ping_client.get("/")
+                        ping_latencies.append(time.perf_counter() - started)
+                        await asyncio.sleep(0.05)
+                return ping_latencies
+
+            ping_task = asyncio.create_task(pinger())
+            started = time.perf_counter()
+            await asyncio.gather(*(uploader() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+            uploading = False
+            ping_latencies = await ping_task
+            memory_after = server_memory(args.server_pid) if args.server_pid else None
+
+            with open(oversized_path, "rb") as media:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(
+                        f"{prefix}/stories/", headers=headers, files={"media_file": ("huge.mp4", media, "video/mp4")}
+                    )
+                    oversized = f"{response.status_code} after {(time.perf_counter() - started) * 1000:.0f} ms"
+                except httpx.HTTPError as e:
+                    # The server may close the connection before the client finishes sending
+                    oversized = f"connection closed after {(time.perf_counter() - started) * 1000:.0f} ms ({e!r})"
+    finally:
+        os.unlink(media_path)
+        os.unlink(oversized_path)
+
+    print(f"uploads:      {len(latencies)} x {args.size_mb:g} MiB ({errors} errors)")
+    print(f"concurrency:  {args.concurrency}")
+    print(f"elapsed:      {elapsed:.2f}s")
+    print(f"throughput:   {len(latencies) * args.size_mb / elapsed:.1f} MiB/s")
+    print(f"latency mean: {statistics.mean(latencies) * 1000:.1f} ms")
+    for pct in (50, 90, 99):
+        print(f"latency p{pct}:  {percentile(latencies, pct) * 1000:.1f} ms")
+    if ping_latencies:
+        print(f"GET / during uploads: p50 {percentile(ping_latencies, 50) * 1000:.1f} ms, "
+              f"p99 {percentile(ping_latencies, 99) * 1000:.1f} ms ({len(ping_latencies)} pings)")
+    if memory_after:
+        print(f"server memory after:  {memory_after}")
+    print(f"oversized ({args.oversized_mb:g} MiB): {oversized}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--api-version", default="v1")
+    parser.add_argument("--email", default="upload-bench@example.com")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--uploads", type=int, default=32)
+    parser.add_argument("--size-mb", type=float, default=50, help="size of each uploaded file")
+    parser.add_argument("--oversized-mb", type=float, default=200, help="size of the file that should be refused")
+    parser.add_argument("--server-pid", type=int, help="server process to read memory usage from")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,133 @@
+"""
+User search latency at scale.
+
+Seeds a scratch database (with the schema, alembic upgrade head) with millions
+of users, then times the typeahead search the way GET /users/search runs it,
+once with the hot prefix cache disabled and once with it enabled:
+
+    DATABASE_URL=postgresql://localhost/stories_search \
+        python benchmarks/user_search.py --seed --users 2000000 --queries 2000
+
+Queries are prefixes of real usernames and names, 1 to 8 characters long, plus
+misspelled names, which need pg_trgm to match. Latency covers the database
+round trips only, not HTTP.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+
+from app.database import SQLALCHEMY_DATABASE_URL, SessionLocal
+from app.utils import user_search
+from concurrent_requests import percentile
+
+FIRST_NAMES = [
+    "Ada", "Alan", "Alex", "Alice", "Amara", "Ana", "Ben", "Carlos", "Chen", "Chloe", "Daniel", "David",
+    "Elena", "Emma", "Fatima", "Grace", "Hana", "Ivan", "James", "Jin", "Julia", "Kai", "Lars", "Leila",
+    "Liam", "Lucas", "Maria", "Mateo", "Maya", "Mohammed", "Nina", "Noah", "Olga", "Omar", "Priya", "Ravi",
+    "Rosa", "Sam", "Sara", "Sofia", "Tariq", "Tom", "Uma", "Victor", "Wei", "Yara", "Yusuf", "Zoe",
+]
+LAST_NAMES = [
+    "Adams", "Ahmed", "Becker", "Brown", "Costa", "Dubois", "Evans", "Fischer", "Garcia", "Gupta", "Hansen",
+    "Ito", "Jensen", "Kim", "Kowalski", "Lee", "Lopez", "Martin", "Meyer", "Muller", "Nguyen", "Novak",
+    "Okafor", "Olsen", "Patel", "Petrov", "Rossi", "Sato", "Schmidt", "Silva", "Singh", "Smith", "Suzuki",
+    "Tanaka", "Taylor", "Wang", "Weber", "Wilson", "Wong", "Yilmaz", "Young", "Zhang",
+]
+
+# Names are picked by hashing the row number, so reseeding gives the same users
+SEED_SQL = [
+    """
+    INSERT INTO users (id, email, username, hashed_password, fullname, created_at)
+    SELECT gen_random_uuid(), 'search' || i || '@example.com',
+           lower(f.name) || CASE abs(hashtext('sep' || i)) % 3 WHEN 0 THEN '.' WHEN 1 THEN '_' ELSE '' END
+               || lower(l.name) || i,
+           'x', f.name || ' ' || l.name, now()
+    FROM generate_series(1, :users) AS i
+    CROSS JOIN LATERAL (
+        SELECT (:first_names)[1 + abs(hashtext('first' || i)) % cardinality(:first_names)] AS name
+    ) AS f
+    CROSS JOIN LATERAL (
+        SELECT (:last_names)[1 + abs(hashtext('last' || i)) % cardinality(:last_names)] AS name
+    ) AS l
+    """,
+    "ANALYZE users",
+]
+
+def seed(args):
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.begin() as conn:
+        for statement in SEED_SQL:
+            conn.execute(text(statement), {"users": args.users, "first_names": FIRST_NAMES, "last_names": LAST_NAMES})
+    engine.dispose()
+
+def misspell(word: str) -> str:
+    """Swap two neighbouring letters"""
+    i = random.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+async def sample_queries(count: int) -> list:
+    async with SessionLocal() as db:
+        result = await db.execute(text(
+            "SELECT username, fullname FROM users TABLESAMPLE SYSTEM (1) WHERE fullname IS NOT NULL LIMIT 10000"
+        ))
+        users = result.all()
+    queries = []
+    for _ in range(count):
+        username, fullname = random.choice(users)
+        kind = random.random()
+        if kind < 0.6:
+            queries.append(username[:random.randint(1, 8)])
+        elif kind < 0.85:
+            queries.append(fullname[:random.randint(1, 8)])
+        else:
+            queries.append(misspell(fullname.split()[-1]))
+    return queries
+
+async def run_queries(queries: list, limit: int) -> list:
+    latencies = []
+    async with SessionLocal() as db:
+        for query in queries:
+            started = time.perf_counter()
+            await user_search.search_users(db, query, 0, limit)
+            latencies.append(time.perf_counter() - started)
+    return latencies
+
+def report(name: str, latencies: list):
+    print(f"{name}:")
+    print(f"  queries:      {len(latencies)}")
+    print(f"  latency mean: {statistics.mean(latencies) * 1000:.2f} ms")
+    for pct in (50, 90, 99):
+        print(f"  latency p{pct}:  {percentile(latencies, pct) * 1000:.2f} ms")
+
+async def run(args):
+    random.seed(args.random_seed)
+    queries = await sample_queries(args.queries)
+    # Warm up the connection, the trigram check and the buffer cache
+    await run_queries(queries[:100], args.limit)
+
+    maxsize = user_search.search_cache.maxsize
+    user_search.search_cache.maxsize = 0
+    report("prefix cache off", await run_queries(queries, args.limit))
+    user_search.search_cache.maxsize = maxsize
+    report("prefix cache on", await run_queries(queries, args.limit))
+    print(f"pg_trgm: {'installed' if user_search.user_search_stats()['trigram'] else 'not installed (prefix only)'}")
+    print(f"cache:   {user_search.search_cache.stats()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="insert the synthetic users first")
+    parser.add_argument("--users", type=int, default=2000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.seed:
+        seed(args)
+    asyncio.run(run(args))
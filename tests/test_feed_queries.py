@@ -0,0 +1,125 @@
+"""
+The home feed (GET /stories/) must issue a fixed number of queries however
+many stories are on the page and however many authors the reader follows: one
+for the page of stories with their authors, one for the reader's likes and
+views of them.
+
+Runs against the database in DATABASE_URL, creating its tables and users with
+random names; skipped without one. Point it at a scratch database.
+"""
+import contextvars
+import io
+import os
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-key-for-feed-query-tests")
+os.environ.setdefault("JWT_ALGORITHM", "HS256")
+
+from fastapi.testclient import TestClient
+
+from app.database import engine
+from app.main import API_PREFIX, app
+from app.routers import stories
+from app.utils import feed
+
+FEED_QUERIES = 2
+STORIES_PER_AUTHOR = 3
+
+# Set only while the app handles a request, so the background flushers'
+# statements are not counted
+_in_request = contextvars.ContextVar("in_request", default=False)
+
+async def counted_app(scope, receive, send):
+    token = _in_request.set(scope["type"] == "http")
+    try:
+        await app(scope, receive, send)
+    finally:
+        _in_request.reset(token)
+
+async def fake_upload_media(file, folder="stories"):
+    await file.read()
+    return "https://example.com/story.jpg"
+
+@pytest.fixture(scope="module")
+def client():
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(stories, "upload_media", fake_upload_media)
+        try:
+            with TestClient(counted_app) as client:
+                yield client
+        except OSError as e:
+            pytest.skip(f"Database unreachable: {e}")
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if _in_request.get():
+            executed.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(engine.sync_engine, "before_cursor_execute", count)
+
+def register(client) -> dict:
+    name = f"feed_{uuid.uuid4().hex[:12]}"
+    credentials = {"username": f"{name}@example.com", "password": "feed-test-password"}
+    response = client.post(
+        f"{API_PREFIX}/auth/register",
+        json={"email": credentials["username"], "username": name, "password": credentials["password"]}
+    )
+    assert response.status_code == 200, response.text
+    user_id = response.json()["id"]
+    response = client.post(f"{API_PREFIX}/auth/login", data=credentials)
+    assert response.status_code == 200, response.text
+    return {"id": user_id, "headers": {"Authorization": f"Bearer {response.json()['access_token']}"}}
+
+def post_stories(client, author: dict) -> None:
+    for _ in range(STORIES_PER_AUTHOR):
+        response = client.post(
+            f"{API_PREFIX}/stories/", headers=author["headers"],
+            files={"media_file": ("story.jpg", io.BytesIO(b"image"), "image/jpeg")}
+        )
+        assert response.status_code == 200, response.text
+
+@pytest.fixture(scope="module")
+def authors(client):
+    """Five authors with followers (fanned out) and one whose stories are merged at read time"""
+    fanned_out = [register(client) for _ in range(5)]
+    merged = register(client)
+    for author in fanned_out:
+        post_stories(client, author)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(feed, "FEED_FANOUT_THRESHOLD", 0)
+        post_stories(client, merged)
+    return fanned_out + [merged]
+
+@pytest.mark.parametrize("follows", [0, 1, 6])
+@pytest.mark.parametrize("limit", [1, 2, 100])
+def test_feed_query_count_is_fixed(client, authors, statements, follows, limit):
+    reader = register(client)
+    post_stories(client, reader)
+    for author in authors[-follows:] if follows else []:
+        response = client.post(f"{API_PREFIX}/users/{author['id']}/follow", headers=reader["headers"])
+        assert response.status_code == 200, response.text
+    expected_stories = STORIES_PER_AUTHOR * (follows + 1)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        statements.clear()
+        response = client.get(f"{API_PREFIX}/stories/", headers=reader["headers"], params=params)
+        assert response.status_code == 200, response.text
+        assert len(statements) == FEED_QUERIES, statements
+        page = response.json()
+        seen += [story["id"] for story in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == expected_stories